@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+"""
+bench_v5.py — synthetic-workload benchmark for the v5 engine (skycut_v5_eng).
+
+What it does:
+  * Generates representative SVG sheets in memory: label grids, nested islands,
+    dense text outlines, long perforation lines and box dielines, each at a
+    range of sizes (number of paths in the Cut layer).
+  * Runs the HPGL build of the extension on every sheet (nothing is sent to
+    a plotter, no viewer is opened) and times each pipeline stage with the
+    extension's own JobStats instrumentation.
+  * Prints a table per workload plus the scaling exponent of every stage
+    (slope of log(time) vs log(paths) between consecutive sizes): ~1 is
+    linear, ~2 is quadratic.
+  * Optionally compares with a previous run (--baseline) and exits with
+    status 1 when a stage got slower or its scaling got worse, so complexity
+    regressions in compute_depths, two_opt or flattening show up before a
+    release.
+
+Usage:
+  python3 bench_v5.py                          # all workloads, 10..1000 paths
+  python3 bench_v5.py --scales 10,100,1000,5000,20000 --budget 300
+  python3 bench_v5.py -w label_grid -w box_dielines --json run.json
+  python3 bench_v5.py --json new.json --baseline old.json
+
+Sizes are approximate: generators emit whole shapes (a box dieline is one
+outline plus its creases), so a workload may land a few paths above the
+requested size. Once one size of a workload takes longer than --budget
+seconds, its larger sizes are skipped.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "extensions"))
+
+from skycut_v5_eng import SkyCutV5Eng, JobStats  # noqa: E402
+
+# Page is A3 landscape with a matching viewBox, so the page-fit scale is 1.0
+# and every shape keeps its size (in mm) at every workload size. Shapes that
+# do not fit on the page simply continue past it - nothing is cut.
+PAGE_W, PAGE_H = 420.0, 297.0
+
+SVG_HEAD = (
+    '<svg xmlns="http://www.w3.org/2000/svg" '
+    'xmlns:inkscape="http://www.inkscape.org/namespaces/inkscape" '
+    f'width="{PAGE_W}mm" height="{PAGE_H}mm" viewBox="0 0 {PAGE_W:g} {PAGE_H:g}">\n'
+    '<g inkscape:groupmode="layer" inkscape:label="Cut">\n'
+)
+SVG_TAIL = '</g>\n</svg>\n'
+
+
+def _path(d, stroke="#ff0000"):
+    return f'<path d="{d}" style="fill:none;stroke:{stroke}"/>\n'
+
+
+def _grid(n, cell_w, cell_h, cols=None):
+    cols = cols or max(1, int(math.ceil(math.sqrt(n))))
+    for k in range(n):
+        yield k, (k % cols) * cell_w, (k // cols) * cell_h
+
+
+def _rounded_rect(x, y, w, h, r):
+    k = r * 0.5523
+    return (f"M {x+r},{y} H {x+w-r} C {x+w-r+k},{y} {x+w},{y+r-k} {x+w},{y+r} "
+            f"V {y+h-r} C {x+w},{y+h-r+k} {x+w-r+k},{y+h} {x+w-r},{y+h} "
+            f"H {x+r} C {x+r-k},{y+h} {x},{y+h-r+k} {x},{y+h-r} "
+            f"V {y+r} C {x},{y+r-k} {x+r-k},{y} {x+r},{y} Z")
+
+
+def _circle(cx, cy, r):
+    return (f"M {cx-r},{cy} A {r},{r} 0 1 1 {cx+r},{cy} "
+            f"A {r},{r} 0 1 1 {cx-r},{cy} Z")
+
+
+# ----------------------------------------------------------------------
+# Workload generators: n -> list of path elements (SVG snippets)
+# ----------------------------------------------------------------------
+
+def gen_label_grid(n):
+    """Print-and-cut labels: rounded rectangles in a regular grid."""
+    return [_path(_rounded_rect(x + 2, y + 2, 40, 25, 3))
+            for _, x, y in _grid(n, 44, 29)]
+
+
+def gen_nested_islands(n):
+    """Islands of a frame, a hole and a part inside the hole (3 levels)."""
+    out = []
+    for k, x, y in _grid((n + 2) // 3, 36, 36):
+        out.append(_path(f"M {x+2},{y+2} h 32 v 32 h -32 Z"))
+        out.append(_path(_circle(x + 18, y + 18, 12)))
+        out.append(_path(f"M {x+12},{y+12} h 12 v 12 h -12 Z"))
+    return out[:max(n, 1)]
+
+
+def gen_text_outlines(n):
+    """Dense glyph-like outlines: small closed curves with counters."""
+    out = []
+    for k, x, y in _grid(n, 7, 10):
+        if k % 3 == 0:      # 'o': outer contour + its concentric counter
+            # Known limitation: compute_depths tests containment at the
+            # centroid, which for the outer contour lies inside its own
+            # counter, so both come out at depth 1 (see compute_depths).
+            out.append(_path(f"M {x+1},{y+5} C {x+1},{y+1} {x+6},{y+1} {x+6},{y+5} "
+                             f"C {x+6},{y+9} {x+1},{y+9} {x+1},{y+5} Z"))
+            out.append(_path(f"M {x+2},{y+5} C {x+2},{y+3} {x+5},{y+3} {x+5},{y+5} "
+                             f"C {x+5},{y+7} {x+2},{y+7} {x+2},{y+5} Z"))
+        elif k % 3 == 1:    # 'i': stem + dot, side by side islands
+            out.append(_path(f"M {x+3},{y+4} h 1.5 v 5 h -1.5 Z"))
+            out.append(_path(f"M {x+3},{y+2.5} C {x+3},{y+1.5} {x+4.5},{y+1.5} "
+                             f"{x+4.5},{y+2.5} C {x+4.5},{y+3.3} {x+3},{y+3.3} "
+                             f"{x+3},{y+2.5} Z"))
+        else:               # 's'-like stroke outline
+            out.append(_path(f"M {x+5},{y+2} C {x+1},{y+1} {x},{y+5} {x+3},{y+5} "
+                             f"C {x+6},{y+5} {x+6},{y+9} {x+1},{y+8} "
+                             f"L {x+1},{y+9} C {x+7},{y+10} {x+7},{y+4} {x+3},{y+4} "
+                             f"C {x+1},{y+4} {x+2},{y+2} {x+5},{y+3} Z"))
+    return out
+
+
+def gen_perforation_lines(n):
+    """Long open wavy lines, cut as dashed (green is set to dashed)."""
+    out = []
+    for k in range(n):
+        y = 5 + k * 4
+        d = f"M 5,{y}"
+        for s in range(10):
+            x0 = 5 + s * 40
+            d += f" C {x0+13},{y-3} {x0+27},{y+3} {x0+40},{y}"
+        out.append(_path(d, "#00ff00"))
+    return out
+
+
+def gen_box_dielines(n):
+    """Box templates: one outer cut outline plus six crease lines each."""
+    out = []
+    for _, x, y in _grid((n + 6) // 7, 130, 110):
+        out.append(_path(
+            f"M {x+20},{y} h 40 l 5,15 h 40 v 70 h -40 l -5,15 h -40 "
+            f"l -5,-15 h -10 v -70 h 10 Z"))
+        for cx in (20, 60, 65, 105):
+            out.append(_path(f"M {x+cx},{y+15} v 70", "#000000"))
+        out.append(_path(f"M {x+10},{y+15} h 95", "#000000"))
+        out.append(_path(f"M {x+10},{y+85} h 95", "#000000"))
+    return out
+
+
+WORKLOADS = {
+    "label_grid":       (gen_label_grid,       []),
+    "nested_islands":   (gen_nested_islands,   []),
+    "text_outlines":    (gen_text_outlines,    []),
+    "perforation_lines": (gen_perforation_lines,
+                          ["--use_colors=true", "--green_dashed=yes"]),
+    "box_dielines":     (gen_box_dielines,     []),
+}
+
+
+# ----------------------------------------------------------------------
+# Running
+# ----------------------------------------------------------------------
+
+def run_once(svg_path, extra_args):
+    """Builds the HPGL for one sheet. Returns (report dict, hpgl bytes)."""
+    ext = SkyCutV5Eng()
+    ext.parse_arguments(["--paper_size=a3l"] + extra_args + [svg_path])
+    with contextlib.redirect_stderr(io.StringIO()):
+        t0 = time.perf_counter()
+        ext.load_raw()
+        load_s = time.perf_counter() - t0
+        ext.stats = JobStats(True)
+        t0 = time.perf_counter()
+        output = ext._build_hpgl()
+        build_s = time.perf_counter() - t0
+    ext.clean_up()
+    report = ext.stats.report()
+    report["load_s"]  = load_s
+    report["build_s"] = build_s
+    return report, len(output or "")
+
+
+def bench_workload(name, scales, repeat, budget, tmpdir):
+    gen, extra = WORKLOADS[name]
+    rows = []
+    for n in scales:
+        elems = gen(n)
+        svg_path = os.path.join(tmpdir, f"{name}_{n}.svg")
+        with open(svg_path, "w", encoding="utf-8") as f:
+            f.write(SVG_HEAD + "".join(elems) + SVG_TAIL)
+        best = None
+        for _ in range(repeat):
+            report, size = run_once(svg_path, extra)
+            if best is None or report["build_s"] < best["build_s"]:
+                best = report
+        stages = {k: v["seconds"] for k, v in best["stages"].items()}
+        rows.append({"paths": len(elems), "load_s": best["load_s"],
+                     "build_s": best["build_s"], "bytes": size,
+                     "stages": stages, "counters": best["counters"]})
+        print(f"  {name:18} {len(elems):6} paths  build {best['build_s']:8.3f} s",
+              file=sys.stderr)
+        if best["build_s"] > budget:
+            print(f"  {name}: over budget ({budget} s), skipping larger sizes",
+                  file=sys.stderr)
+            break
+    return rows
+
+
+def scaling_exponents(rows, key):
+    """Slope of log(time) vs log(paths) between consecutive sizes."""
+    out = []
+    for a, b in zip(rows, rows[1:]):
+        ta, tb = key(a), key(b)
+        if ta > 1e-5 and tb > 1e-5 and b["paths"] > a["paths"]:
+            out.append(math.log(tb / ta) / math.log(b["paths"] / a["paths"]))
+        else:
+            out.append(None)
+    return out
+
+
+def format_report(results):
+    lines = []
+    for name, rows in results.items():
+        if not rows:
+            continue
+        stage_names = sorted({s for r in rows for s in r["stages"]},
+                             key=lambda s: -max(r["stages"].get(s, 0) for r in rows))
+        lines.append(f"== {name}")
+        lines.append(f"{'stage':22}" + "".join(f"{r['paths']:>10}" for r in rows)
+                     + "   exponent")
+        series = [("build (total)", lambda r: r["build_s"]),
+                  ("load svg", lambda r: r["load_s"])]
+        series += [(s, lambda r, s=s: r["stages"].get(s, 0.0)) for s in stage_names]
+        for label, key in series:
+            exps = [e for e in scaling_exponents(rows, key) if e is not None]
+            exp = f"{exps[-1]:9.2f}" if exps else f"{'-':>9}"
+            lines.append(f"{label:22}" + "".join(f"{key(r):10.4f}" for r in rows)
+                         + "  " + exp)
+        lines.append(f"{'hpgl bytes':22}" + "".join(f"{r['bytes']:>10}" for r in rows))
+        lines.append("")
+    return "\n".join(lines)
+
+
+def compare(results, baseline, tolerance):
+    """Returns a list of regressions against a previous --json run."""
+    problems = []
+    for name, rows in results.items():
+        old_rows = {r["paths"]: r for r in baseline.get(name, [])}
+        for r in rows:
+            old = old_rows.get(r["paths"])
+            if old is None:
+                continue
+            for stage, t in list(r["stages"].items()) + [("build", r["build_s"])]:
+                t_old = old["build_s"] if stage == "build" else old["stages"].get(stage)
+                if t_old and t > 0.01 and t > t_old * tolerance:
+                    problems.append(f"{name} @ {r['paths']} paths: {stage} "
+                                    f"{t_old:.4f} s -> {t:.4f} s")
+        old_list = baseline.get(name, [])
+        new_exp = scaling_exponents(rows, lambda r: r["build_s"])
+        old_exp = scaling_exponents(old_list, lambda r: r["build_s"])
+        if (new_exp and old_exp and new_exp[-1] is not None and old_exp[-1] is not None
+                and len(rows) == len(old_list) and new_exp[-1] > old_exp[-1] + 0.3):
+            problems.append(f"{name}: scaling exponent {old_exp[-1]:.2f} -> "
+                            f"{new_exp[-1]:.2f}")
+    return problems
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("-w", "--workload", action="append", choices=sorted(WORKLOADS),
+                    help="workload to run (repeatable, default: all)")
+    ap.add_argument("--scales", default="10,100,1000",
+                    help="comma-separated path counts (max 20000 is sensible)")
+    ap.add_argument("--repeat", type=int, default=1, help="runs per size, best kept")
+    ap.add_argument("--budget", type=float, default=60.0,
+                    help="skip larger sizes once one run exceeds this (seconds)")
+    ap.add_argument("--json", help="write the raw results to this file")
+    ap.add_argument("--out", help="also write the text report to this file")
+    ap.add_argument("--baseline", help="previous --json results to compare with")
+    ap.add_argument("--tolerance", type=float, default=1.5,
+                    help="slow-down factor that counts as a regression")
+    args = ap.parse_args()
+
+    scales = sorted({int(s) for s in args.scales.split(",") if s.strip()})
+    names  = args.workload or list(WORKLOADS)
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="skycut_bench_") as tmpdir:
+        for name in names:
+            results[name] = bench_workload(name, scales, max(1, args.repeat),
+                                           args.budget, tmpdir)
+
+    text = format_report(results)
+    print(text)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=1)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            problems = compare(results, json.load(f), args.tolerance)
+        for p in problems:
+            print(f"REGRESSION: {p}")
+        if problems:
+            sys.exit(1)
+        print("No regressions against baseline.")
+
+
+if __name__ == "__main__":
+    main()
@@ -11,32 +11,186 @@ Principle:
 """
 
 import inkex
-from inkex import PathElement
-from inkex.paths import CubicSuperPath, ZoneClose
+from inkex import (PathElement, Rectangle, Circle, Ellipse, Line, Polyline, Polygon,
+                   BaseElement, Transform, Use)
+import asyncio
+import json
+from array import array
 import socket
 import math
+import os
 import re
 import tempfile
+import time
 import webbrowser
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from functools import partial
 from itertools import groupby
 
 # ---------------------------------------------------------------------------
 # Constants
 # ---------------------------------------------------------------------------
 SCALE            = 40        # HPGL units per mm
-STEPS_PER_SEG   = 20        # Bezier subdivision steps
+ARC_LUT_STEPS    = 8         # Arc-length table intervals per Bezier segment
 MIN_DIST_MM      = 0.05     # Minimum point distance (mm)
 CURVE_STEP_MM    = 0.5      # Resample step for curves (mm)
+PARALLEL_MIN     = 64       # Fewer paths than this are never sent to workers
+SEAM_WINDOW      = 12       # Paths each side of a cluster seam re-run through 2-opt
+HILBERT_MIN      = 2000     # Longer tours start from a Hilbert curve (route_seed=auto)
+NEIGHBORS        = 8        # Nearest points tried per point by improve_tour()
+MERGE_DEV_UNITS  = 0.5      # Collinear merge: max distance from the chord (plotter units)
 
 # ---------------------------------------------------------------------------
 # Geometry helpers
 # ---------------------------------------------------------------------------
 
-def cubic_point(p0, c1, c2, p1, t):
-    mt = 1 - t
-    x = mt**3*p0[0] + 3*mt**2*t*c1[0] + 3*mt*t**2*c2[0] + t**3*p1[0]
-    y = mt**3*p0[1] + 3*mt**2*t*c1[1] + 3*mt*t**2*c2[1] + t**3*p1[1]
-    return x, y
+# 5-point Gauss-Legendre nodes and weights on [-1, 1]
+_GL5 = ((0.0, 0.5688888888888889),
+        (-0.5384693101056831, 0.4786286704993665),
+        (0.5384693101056831, 0.4786286704993665),
+        (-0.9061798459386640, 0.2369268850561891),
+        (0.9061798459386640, 0.2369268850561891))
+
+
+def cubic_length_table(p0, c1, c2, p1, n=ARC_LUT_STEPS):
+    """Cumulative arc length of the cubic at t = 0, 1/n, ... 1.
+    Each interval integrates |B'(t)| with 5-point Gauss-Legendre."""
+    # B'(t) = 3*(mt^2*A + 2*mt*t*B + t^2*C)
+    ax = c1[0]-p0[0]; ay = c1[1]-p0[1]
+    bx = c2[0]-c1[0]; by = c2[1]-c1[1]
+    cx = p1[0]-c2[0]; cy = p1[1]-c2[1]
+    hypot = math.hypot
+    table = [0.0]
+    acc = 0.0
+    h = 0.5 / n
+    for k in range(n):
+        mid = (k + 0.5) / n
+        part = 0.0
+        for x, w in _GL5:
+            t = mid + x*h; mt = 1 - t
+            a = mt*mt; b = 2*mt*t; c = t*t
+            part += w * hypot(a*ax + b*bx + c*cx, a*ay + b*by + c*cy)
+        acc += 3*h*part
+        table.append(acc)
+    return table
+
+
+def sample_cubic(out, p0, c1, c2, p1, step_len):
+    """Appends the cubic (p0, c1, c2, p1) to out (which already ends at
+    p0), sampled at uniform arc-length intervals of about step_len mm:
+    round(length / step_len) equal steps placed on the curve itself by
+    inverting its cubic_length_table. p1 is always appended, so corners
+    between segments stay sharp."""
+    # One Gauss-Legendre pass decides if the curve needs inner points
+    d = cubic_length_table(p0, c1, c2, p1, 1)[-1]
+    steps = int(round(d / step_len))
+    if steps > 1:
+        n_lut = ARC_LUT_STEPS
+        lut = cubic_length_table(p0, c1, c2, p1)
+        d = lut[-1]
+        step = d / steps
+        # Power basis: B(t) = ((a*t + b)*t + c)*t + p0
+        cx = 3*(c1[0]-p0[0]); bx = 3*(c2[0]-c1[0]) - cx
+        ax = p1[0] - p0[0] - cx - bx
+        cy = 3*(c1[1]-p0[1]); by = 3*(c2[1]-c1[1]) - cy
+        ay = p1[1] - p0[1] - cy - by
+        x0, y0 = p0
+        j = 1
+        for k in range(1, steps):
+            s = k * step
+            while j < n_lut and lut[j] < s:
+                j += 1
+            span = lut[j] - lut[j-1]
+            frac = (s - lut[j-1]) / span if span > 0 else 0.0
+            t = (j - 1 + frac) / n_lut
+            out.append((((ax*t + bx)*t + cx)*t + x0,
+                        ((ay*t + by)*t + cy)*t + y0))
+    out.append(p1)
+
+
+def ellipse_arc_points(ox, oy, ux, uy, vx, vy, th0, dth, step_len, min_steps=1):
+    """Inner points of the elliptical arc P(th) = O + U*cos(th) + V*sin(th),
+    th from th0 to th0 + dth, at uniform arc-length intervals of about
+    step_len (at least min_steps steps). None for a degenerate arc."""
+    hypot = math.hypot; cos = math.cos; sin = math.sin
+    sgn = 1.0 if dth >= 0 else -1.0
+    n_lut = max(2, int(math.ceil(4 * ARC_LUT_STEPS * abs(dth) / (2*math.pi) - 1e-9)))
+    h = abs(dth) / (2*n_lut)        # half interval of u in [0, |dth|]
+    table = [0.0]
+    acc = 0.0
+    for k in range(n_lut):
+        mid = (2*k + 1) * h
+        part = 0.0
+        for x, w in _GL5:
+            th = th0 + sgn*(mid + x*h)
+            part += w * hypot(-ux*sin(th) + vx*cos(th), -uy*sin(th) + vy*cos(th))
+        acc += h*part
+        table.append(acc)
+    total = table[-1]
+    if total < 0.001:
+        return None
+    steps = max(min_steps, int(round(total / step_len)))
+    step = total / steps
+    pts = []
+    j = 1
+    for k in range(1, steps):
+        s = k * step
+        while j < n_lut and table[j] < s:
+            j += 1
+        span = table[j] - table[j-1]
+        frac = (s - table[j-1]) / span if span > 0 else 0.0
+        th = th0 + sgn*((j - 1 + frac) * 2 * h)
+        ct = cos(th); st = sin(th)
+        pts.append((ox + ux*ct + vx*st, oy + uy*ct + vy*st))
+    return pts
+
+
+def sample_ellipse(cx, cy, rx, ry, hexad, scale_x, scale_y, step_len):
+    """Closed contour of an ellipse (cx, cy, rx, ry) under the affine
+    transform hexad = (a, b, c, d, e, f), at uniform arc-length intervals
+    of about step_len mm. Starts at the top and runs the same way as the
+    arc path inkex builds for circle/ellipse; the start point is repeated
+    at the end."""
+    a, b, c, d, e, f = hexad
+    # P(u) = M*(rx*cos(th), ry*sin(th)) + (e', f'), th = -pi/2 - u
+    ux, uy = a*rx*scale_x, b*rx*scale_y
+    vx, vy = c*ry*scale_x, d*ry*scale_y
+    ox = (a*cx + c*cy + e) * scale_x
+    oy = (b*cx + d*cy + f) * scale_y
+    start = (ox - vx, oy - vy)
+    inner = ellipse_arc_points(ox, oy, ux, uy, vx, vy, -math.pi/2, -2*math.pi,
+                               step_len, 8)
+    if inner is None:
+        return [start]
+    return [start] + inner + [start]
+
+
+def _arc_center(x1, y1, rx, ry, phi, large, sweep, x2, y2):
+    """SVG endpoint arc -> (cx, cy, rx, ry, th1, dth), radii scaled up
+    when too small (SVG 1.1 F.6.5/F.6.6). phi in radians."""
+    cp = math.cos(phi); sp = math.sin(phi)
+    hx = (x1 - x2) / 2; hy = (y1 - y2) / 2
+    x1p = cp*hx + sp*hy; y1p = -sp*hx + cp*hy
+    lam = (x1p*x1p) / (rx*rx) + (y1p*y1p) / (ry*ry)
+    if lam > 1:
+        lam = math.sqrt(lam); rx *= lam; ry *= lam
+    num = rx*rx*ry*ry - rx*rx*y1p*y1p - ry*ry*x1p*x1p
+    den = rx*rx*y1p*y1p + ry*ry*x1p*x1p
+    co = math.sqrt(max(0.0, num / den)) if den else 0.0
+    if large == sweep:
+        co = -co
+    cxp = co * rx * y1p / ry; cyp = -co * ry * x1p / rx
+    cx = cp*cxp - sp*cyp + (x1 + x2) / 2
+    cy = sp*cxp + cp*cyp + (y1 + y2) / 2
+    th1 = math.atan2((y1p - cyp) / ry, (x1p - cxp) / rx)
+    th2 = math.atan2((-y1p - cyp) / ry, (-x1p - cxp) / rx)
+    dth = th2 - th1
+    if sweep and dth < 0:
+        dth += 2*math.pi
+    elif not sweep and dth > 0:
+        dth -= 2*math.pi
+    return cx, cy, rx, ry, th1, dth
 
 
 def is_straight(p0, c1, c2, p1, tol=0.01):
@@ -60,50 +214,117 @@ def dedup_pts(pts, min_dist=0.001):
     return out
 
 
-def collinear_clean(pts):
+def _within(run, b, a, c, max_dev):
+    """True if b and every point in run lie within max_dev of the segment
+    a-c (distance clamped to its end points)."""
+    ax, ay = a
+    dx = c[0] - ax; dy = c[1] - ay
+    ll = dx*dx + dy*dy
+    lim = max_dev * max_dev
+    for p in (b, *run):
+        px = p[0] - ax; py = p[1] - ay
+        t = (px*dx + py*dy) / ll
+        if t < 0.0:
+            t = 0.0
+        elif t > 1.0:
+            t = 1.0
+        ex = px - t*dx; ey = py - t*dy
+        if ex*ex + ey*ey > lim:
+            return False
+    return True
+
+
+def collinear_clean(pts, tol=0.001, max_dev=0.0):
+    """Merges runs of collinear points. tol is the cross-product (twice the
+    triangle area) limit.
+
+    With max_dev, a point joins the run only if every point merged into
+    the run so far lies within max_dev of the new chord (run start to the
+    point); tol is then not used. Each point is checked against the final
+    chord, so the error cannot build up along a curve."""
     if len(pts) <= 2:
         return pts
     cleaned = [pts[0], pts[1]]
+    run = []        # points merged away since cleaned[-2]
     for pt in pts[2:]:
         a = cleaned[-2]; b = cleaned[-1]
-        area = abs((b[0]-a[0])*(pt[1]-a[1]) - (b[1]-a[1])*(pt[0]-a[0]))
-        if area < 0.001 and math.hypot(pt[0]-a[0], pt[1]-a[1]) > 0.001:
+        if math.hypot(pt[0]-a[0], pt[1]-a[1]) <= 0.001:
+            merge = False
+        elif max_dev:
+            merge = _within(run, b, a, pt, max_dev)
+        else:
+            area = abs((b[0]-a[0])*(pt[1]-a[1]) - (b[1]-a[1])*(pt[0]-a[0]))
+            merge = area < tol
+        if merge:
+            run.append(b)
             cleaned[-1] = pt
         else:
             cleaned.append(pt)
+            run = []
     return cleaned
 
 
-def resample_by_length(pts, step_len):
-    """Redistributes points evenly at step_len mm intervals.
-    Works on an open list - does not assume closure."""
-    if len(pts) < 2 or step_len <= 0:
-        return pts
-    segments = []
-    total = 0.0
-    for i in range(len(pts) - 1):
-        d = math.hypot(pts[i+1][0]-pts[i][0], pts[i+1][1]-pts[i][1])
-        segments.append((pts[i], pts[i+1], d))
-        total += d
-    if total < 0.001:
-        return pts
-    steps = max(3, int(round(total / step_len)))
-    step  = total / steps
-    result = [pts[0]]
-    seg_i = 0; seg_start = 0.0
-    for k in range(1, steps):
-        target = k * step
-        while seg_i < len(segments):
-            p0, p1, d = segments[seg_i]
-            if d < 0.001:
-                seg_start += d; seg_i += 1; continue
-            if target <= seg_start + d + 1e-9:
-                t = (target - seg_start) / d
-                result.append((p0[0]+(p1[0]-p0[0])*t, p0[1]+(p1[1]-p0[1])*t))
-                break
-            seg_start += d; seg_i += 1
-    result.append(pts[-1])
-    return result
+def clean_polyline(pts, u=1.0):
+    """Drops repeated points and merges collinear runs of a polyline about
+    to be emitted (u as in emit_open_path). A run is merged while every
+    merged point stays within MERGE_DEV_UNITS of the final chord, which
+    is below what the plotter can resolve. Quantized points carry up to
+    another half unit of rounding noise, which is allowed on top."""
+    pts = dedup_pts(pts, 0.001*u)
+    dev = MERGE_DEV_UNITS if u == 1.0 else MERGE_DEV_UNITS + 0.5
+    return collinear_clean(pts, max_dev=dev*u/SCALE)
+
+
+def quantize_pts(pts, scale=SCALE):
+    """mm -> integer plotter units. Points that land on the same unit as
+    the previous one are dropped (exact integer dedup)."""
+    out = []
+    last = None
+    for p in pts:
+        q = (round(p[0]*scale), round(p[1]*scale))
+        if q != last:
+            out.append(q)
+            last = q
+    return out
+
+
+def simplify_rdp(pts, tol, keep=()):
+    """Ramer-Douglas-Peucker: drops points that lie within tol of the chord
+    that replaces them. The end points and the indices in keep (knife-offset
+    ears) always stay, and the polyline is simplified between them."""
+    n = len(pts)
+    if tol <= 0 or n < 3:
+        return list(pts)
+    mark = bytearray(n)
+    mark[0] = mark[-1] = 1
+    for k in keep:
+        if 0 <= k < n:
+            mark[k] = 1
+    anchors = [i for i in range(n) if mark[i]]
+    stack = [(a, b) for a, b in zip(anchors, anchors[1:]) if b - a > 1]
+    while stack:
+        a, b = stack.pop()
+        ax, ay = pts[a]; bx, by = pts[b]
+        dx = bx - ax; dy = by - ay
+        ll = dx*dx + dy*dy
+        worst = -1.0; at = a
+        for i in range(a + 1, b):
+            px = pts[i][0] - ax; py = pts[i][1] - ay
+            if ll > 0:
+                # distance to the segment, clamped to its end points
+                t = max(0.0, min(1.0, (px*dx + py*dy) / ll))
+                d = math.hypot(px - t*dx, py - t*dy)
+            else:
+                d = math.hypot(px, py)
+            if d > worst:
+                worst = d; at = i
+        if worst > tol:
+            mark[at] = 1
+            if at - a > 1:
+                stack.append((a, at))
+            if b - at > 1:
+                stack.append((at, b))
+    return [pts[i] for i in range(n) if mark[i]]
 
 
 # ---------------------------------------------------------------------------
@@ -288,14 +509,14 @@ def _corner_arc_v21(apex, in_nx, in_ny, out_nx, out_ny, k_off):
     return arc
 
 
-def apply_corner_offset(pts, k_off, sensitivity=50):
+def apply_corner_offset(pts, k_off, sensitivity=50, win_dist=1.5, ears=None):
     """Adds a knife-offset arc on sharp corners.
 
     Distinguishes a sharp corner from a rounded curve by the concentration
     of the turn:
     - Sharp corner (star, flap, square corner): the turn is concentrated
       at one point. The immediate angle ~= the angle measured in a wider
-      window (+-WIN_DIST mm).
+      window (+-win_dist, 1.5 mm by default).
     - Rounding (arc): the turn is distributed. The wide-window angle is
       significantly larger than the immediate one.
 
@@ -303,6 +524,10 @@ def apply_corner_offset(pts, k_off, sensitivity=50):
       0   = conservative (only very sharp corners, few ears)
       50  = balanced (default)
       100 = aggressive (more ears, even on softer corners)
+
+    k_off and win_dist are in the units of pts (mm, or plotter units in
+    quantized mode). If ears is a list, the result indices of every ear
+    point are appended to it.
     """
     if k_off <= 0 or len(pts) < 5:
         return list(pts)
@@ -314,7 +539,7 @@ def apply_corner_offset(pts, k_off, sensitivity=50):
     MIN_IMM_ANG = math.radians(45 - s * 27)
     # CONC_RATIO: 0.70 (conservative) -> 0.40 (aggressive)
     CONC_RATIO  = 0.70 - s * 0.30
-    WIN_DIST    = 1.5               # +-1.5mm window for measuring concentration
+    WIN_DIST    = win_dist          # +-window for measuring concentration
 
     def seg_dir(a, b):
         dx = b[0]-a[0]; dy = b[1]-a[1]
@@ -362,6 +587,8 @@ def apply_corner_offset(pts, k_off, sensitivity=50):
 
         arc = _corner_arc_v21(apex, in_nx, in_ny, out_nx, out_ny, k_off)
         if arc:
+            if ears is not None:
+                ears.extend(range(len(result), len(result) + len(arc)))
             result.extend(arc)
         else:
             result.append(apex)
@@ -369,37 +596,283 @@ def apply_corner_offset(pts, k_off, sensitivity=50):
     result.append(pts[-1])
     return result
 
-def emit_open_path(hpgl, pts, coord):
+
+# ---------------------------------------------------------------------------
+# HPGL job (intermediate representation)
+# ---------------------------------------------------------------------------
+
+OP_UP, OP_DOWN, OP_TOOL, OP_FS, OP_VS, OP_US, OP_RAW = range(7)
+
+# Prefix of the one-argument state commands, indexed by opcode
+_STATE_PREFIX = {OP_TOOL: "P", OP_FS: "FS", OP_VS: "VS", OP_US: "US"}
+
+# Runs of one repeated opcode byte (serializer works run by run)
+_OP_RUN = re.compile(rb'(.)\1*', re.S)
+
+
+class HpglJob:
+    """A job as parallel compact arrays instead of a list of strings.
+
+    ops - one opcode per command (array of unsigned bytes)
+    xy  - two int32 per command: (x, y) for U/D, (value, 0) for P/FS/VS/US,
+          (index into raw, 0) for verbatim commands (header, footer)
+
+    The emitters write into it, serialize() turns it into the bytes that go
+    to the plotter, and the estimator / optimizers walk it with ops() without
+    parsing text.
+    """
+
+    __slots__ = ('ops', 'xy', 'raw')
+
+    def __init__(self):
+        self.ops = array('B')
+        self.xy  = array('i')
+        self.raw = []
+
+    def __len__(self):
+        return len(self.ops)
+
+    def _add(self, op, a, b=0):
+        self.ops.append(op)
+        self.xy.append(a); self.xy.append(b)
+
+    def up(self, x, y):
+        self._add(OP_UP, x, y)
+
+    def down(self, x, y):
+        self._add(OP_DOWN, x, y)
+
+    def down_many(self, xs, ys):
+        """Appends one D per (x, y) pair."""
+        n = len(xs)
+        if not n:
+            return
+        flat = [0] * (2 * n)
+        flat[0::2] = xs; flat[1::2] = ys
+        self.ops.extend(bytes((OP_DOWN,)) * n)
+        self.xy.extend(flat)
+
+    def tool(self, name):
+        """name: "P0" / "P1"."""
+        self._add(OP_TOOL, int(name[1:]))
+
+    def force(self, fs):
+        self._add(OP_FS, fs)
+
+    def speed(self, vs):
+        self._add(OP_VS, vs)
+
+    def travel_speed(self, us):
+        self._add(OP_US, us)
+
+    def verbatim(self, text):
+        """Any other command, sent as given (including the ';')."""
+        if text:
+            self._add(OP_RAW, len(self.raw))
+            self.raw.append(text)
+
+    def ops_iter(self):
+        """Yields (opcode, a, b) for every command."""
+        xy = self.xy
+        for i, op in enumerate(self.ops):
+            yield op, xy[2*i], xy[2*i+1]
+
+    def serialize(self):
+        """The job as the bytes sent to the plotter.
+
+        Works on runs of equal opcodes: each run is formatted with a single
+        %-operation over a slice of xy instead of one f-string per command.
+        """
+        out = []
+        append = out.append
+        raw = self.raw
+        xy = self.xy
+        for m in _OP_RUN.finditer(self.ops.tobytes()):
+            i, j = m.span()
+            op = self.ops[i]
+            if op == OP_DOWN or op == OP_UP:
+                tmpl = "D%d,%d;" if op == OP_DOWN else "U%d,%d;"
+                append((tmpl * (j - i)) % tuple(xy[2*i:2*j]))
+            elif op == OP_RAW:
+                append("".join([raw[a] for a in xy[2*i:2*j:2]]))
+            else:
+                append((_STATE_PREFIX[op] + "%d;") * (j - i) % tuple(xy[2*i:2*j:2]))
+        return "".join(out).encode('ascii')
+
+    @classmethod
+    def from_text(cls, text):
+        """Parses HPGL text (as produced by serialize) back into a job."""
+        job = cls()
+        for cmd in text.split(';'):
+            c = cmd.strip()
+            if not c:
+                continue
+            try:
+                if c[0] in 'UD' and not c.startswith('US'):
+                    x, y = (int(v) for v in c[1:].split(','))
+                    job._add(OP_UP if c[0] == 'U' else OP_DOWN, x, y)
+                    continue
+                for op, prefix in _STATE_PREFIX.items():
+                    if c.startswith(prefix) and c[len(prefix):].isdigit():
+                        job._add(op, int(c[len(prefix):]))
+                        break
+                else:
+                    job.verbatim(c + ';')
+            except ValueError:
+                job.verbatim(c + ';')
+        return job
+
+
+class PlotterFrame:
+    """Document mm -> plotter units (rotation + mirror, see COMMANDS.md):
+        x = (ref_y - (py - min_y)) * SCALE,  y = (ref_x - (px - min_x)) * SCALE
+    Marker mode: ref = work size, min = marker corner.
+    Otherwise:   ref = bbox max, min = 0.
+    In quantized mode everything is already in plotter units and scale=1.
+
+    Callable for one point; many() converts a whole polyline at once.
+    """
+
+    __slots__ = ('ref_x', 'ref_y', 'min_x', 'min_y', 'scale')
+
+    def __init__(self, ref_x, ref_y, min_x=0.0, min_y=0.0, scale=SCALE):
+        self.ref_x = ref_x; self.ref_y = ref_y
+        self.min_x = min_x; self.min_y = min_y
+        self.scale = scale
+
+    def __call__(self, px, py):
+        return (int(round((self.ref_y-(py-self.min_y))*self.scale)),
+                int(round((self.ref_x-(px-self.min_x))*self.scale)))
+
+    def home(self):
+        """Document point at the plotter origin (where the head starts
+        and returns to)."""
+        return (self.ref_x + self.min_x, self.ref_y + self.min_y)
+
+    def many(self, pts):
+        """Returns (xs, ys): the plotter coordinates of all pts."""
+        ry, my = self.ref_y, self.min_y
+        rx, mx = self.ref_x, self.min_x
+        k = self.scale
+        xs = [round((ry-(p[1]-my))*k) for p in pts]
+        ys = [round((rx-(p[0]-mx))*k) for p in pts]
+        return xs, ys
+
+
+def _cmd_bytes(op, a, b, raw):
+    if op == OP_RAW:
+        return len(raw[a])
+    if op == OP_UP or op == OP_DOWN:
+        return len(f"U{a},{b};")
+    return len(f"{_STATE_PREFIX[op]}{a};")
+
+
+def peephole_optimize(job):
+    """Removes redundant state and motion commands; the cut geometry (every
+    pen-down move) stays exactly the same.
+
+    Dropped:
+      * consecutive U moves - only the last one matters (e.g. the U on the
+        current position that ends a path, followed by the U to the next start)
+      * a U to the position where the pen is already up
+      * a D to the current position while the pen is already down
+      * FS / VS / US equal to the value already in effect
+
+    A tool change or a verbatim command (IN, CMD:...) forgets the known
+    force/speed, so those are re-sent after it. A U is never merged across a
+    tool change, so the blade is always lifted before switching tools.
+
+    Returns (optimized job, {'commands_saved': n, 'bytes_saved': n}).
+    """
+    out = HpglJob()
+    out.raw = job.raw
+    raw = job.raw
+    saved_cmds = saved_bytes = 0
+    state = {}              # opcode -> last value for FS / VS / US
+    pen = None; pos = None
+    pending_up = None
+
+    def flush_up():
+        nonlocal pen, pos, pending_up, saved_cmds, saved_bytes
+        if pending_up is None:
+            return
+        if pen == OP_UP and pos == pending_up:
+            saved_cmds += 1
+            saved_bytes += _cmd_bytes(OP_UP, pending_up[0], pending_up[1], raw)
+        else:
+            out.up(*pending_up)
+            pen = OP_UP; pos = pending_up
+        pending_up = None
+
+    for op, a, b in job.ops_iter():
+        if op == OP_UP:
+            if pending_up is not None:
+                saved_cmds += 1
+                saved_bytes += _cmd_bytes(OP_UP, pending_up[0], pending_up[1], raw)
+            pending_up = (a, b)
+            continue
+        flush_up()
+        if op == OP_DOWN:
+            if pen == OP_DOWN and pos == (a, b):
+                saved_cmds += 1; saved_bytes += _cmd_bytes(op, a, b, raw)
+                continue
+            out.down(a, b)
+            pen = OP_DOWN; pos = (a, b)
+        elif op in (OP_FS, OP_VS, OP_US):
+            if state.get(op) == a:
+                saved_cmds += 1; saved_bytes += _cmd_bytes(op, a, b, raw)
+                continue
+            state[op] = a
+            out._add(op, a)
+        else:
+            if op == OP_TOOL:
+                state.pop(OP_FS, None); state.pop(OP_VS, None)
+            else:
+                state.clear(); pen = None; pos = None
+            out._add(op, a, b)
+    flush_up()
+    return out, {'commands_saved': saved_cmds, 'bytes_saved': saved_bytes}
+
+
+def emit_open_path(job, pts, coord, u=1.0):
     """Emits an open path: U start; D p1; D p2; ... U last;
     Assumes pts is already open (no closure needed).
+    u = length of 1 mm in the units of pts (1.0, or SCALE when quantized).
     """
-    pts = dedup_pts(pts)
-    pts = collinear_clean(pts)
+    pts = clean_polyline(pts, u)
+    min_dist = MIN_DIST_MM*u
     if not pts:
         return
 
-    sx, sy = coord(pts[0][0], pts[0][1])
-    hpgl.append(f"U{sx},{sy};")
+    # Whole polyline to plotter units in one step, then keep the points
+    # that move at least MIN_DIST_MM and land on a new plotter unit.
+    xs, ys = coord.many(pts)
+    sx, sy = xs[0], ys[0]
+    job.up(sx, sy)
 
     last_tx, last_ty = sx, sy
     last_rx, last_ry = pts[0]
+    out_x = []; out_y = []
+    hypot = math.hypot
+    last = len(pts) - 1
 
     for i in range(1, len(pts)):
         px, py = pts[i]
         # Skip only internal duplicates, the last point always passes
-        if i != len(pts)-1 and math.hypot(px-last_rx, py-last_ry) < MIN_DIST_MM:
+        if i != last and hypot(px-last_rx, py-last_ry) < min_dist:
             continue
-        tx, ty = coord(px, py)
-        if (tx, ty) != (last_tx, last_ty):
-            hpgl.append(f"D{tx},{ty};")
+        tx = xs[i]; ty = ys[i]
+        if tx != last_tx or ty != last_ty:
+            out_x.append(tx); out_y.append(ty)
             last_tx, last_ty = tx, ty
             last_rx, last_ry = px, py
 
-    hpgl.append(f"U{last_tx},{last_ty};")
+    job.down_many(out_x, out_y)
+    job.up(last_tx, last_ty)
 
 
-def emit_dashed_path(hpgl, pts, coord, dash_mm, gap_mm,
-                     dash_fs, gap_fs, cut_quickly, base_fs):
+def emit_dashed_path(job, pts, coord, dash_mm, gap_mm,
+                     dash_fs, gap_fs, cut_quickly, base_fs, u=1.0):
     """Emits a dashed line: walks pts, alternating dash (cut) and gap.
 
     dash_mm / gap_mm  - lengths of the cut segment and the gap
@@ -407,25 +880,26 @@ def emit_dashed_path(hpgl, pts, coord, dash_mm, gap_mm,
     cut_quickly       - True: blade stays down, only changes FS
                         False: lifts the blade (U) in the gaps
     base_fs           - the color's base force (when dash/gap_fs are None)
+    u                 - length of 1 mm in the units of pts (SCALE when quantized)
 
     Behavior reproduced from the original plugin:
       cut_quickly + forces:  FS<dash>;D..D.. FS<gap>;D..D.. (blade down)
       cut_quickly without forces: only base_fs, but still U in the gaps
       without cut_quickly:        lifts the blade (U) at the start of each gap
     """
-    pts = dedup_pts(pts)
-    pts = collinear_clean(pts)
+    pts = clean_polyline(pts, u)
     if len(pts) < 2:
         return
+    dash_mm *= u; gap_mm *= u
 
     df = dash_fs if dash_fs is not None else base_fs
     gf = gap_fs  if gap_fs  is not None else base_fs
 
     # Start position
     sx, sy = coord(pts[0][0], pts[0][1])
-    hpgl.append(f"U{sx},{sy};")
+    job.up(sx, sy)
     if cut_quickly:
-        hpgl.append(f"FS{df};")
+        job.force(df)
     cur_fs = df
     last_tx, last_ty = sx, sy
 
@@ -438,9 +912,9 @@ def emit_dashed_path(hpgl, pts, coord, dash_mm, gap_mm,
         nonlocal last_tx, last_ty, pen_down
         tx, ty = coord(rx, ry)
         if cutting:
-            hpgl.append(f"D{tx},{ty};")
+            job.down(tx, ty)
         else:
-            hpgl.append(f"U{tx},{ty};")
+            job.up(tx, ty)
         last_tx, last_ty = tx, ty
         pen_down = cutting
 
@@ -472,14 +946,14 @@ def emit_dashed_path(hpgl, pts, coord, dash_mm, gap_mm,
                 if in_dash:
                     if cut_quickly:
                         if cur_fs != df:
-                            hpgl.append(f"FS{df};"); cur_fs = df
+                            job.force(df); cur_fs = df
                     else:
                         # lifted blade must come down for the new dash
                         move_to(cx, cy, True)
                 else:
                     if cut_quickly:
                         if cur_fs != gf:
-                            hpgl.append(f"FS{gf};"); cur_fs = gf
+                            job.force(gf); cur_fs = gf
                     else:
                         # gap begins -> lift the blade at the current point
                         move_to(cx, cy, False)
@@ -498,40 +972,217 @@ def emit_dashed_path(hpgl, pts, coord, dash_mm, gap_mm,
             if in_dash:
                 if cut_quickly:
                     if cur_fs != df:
-                        hpgl.append(f"FS{df};"); cur_fs = df
+                        job.force(df); cur_fs = df
                 else:
                     move_to(cx, cy, True)
             else:
                 if cut_quickly:
                     if cur_fs != gf:
-                        hpgl.append(f"FS{gf};"); cur_fs = gf
+                        job.force(gf); cur_fs = gf
                 else:
                     move_to(cx, cy, False)
 
-    hpgl.append(f"U{last_tx},{last_ty};")
-
-def _stroke_to_color(elem):
-    """Returns the color name (black/red/green/yellow) of the element.
-    Unrecognized color -> 'red' (treated as cutting by default)."""
-    stroke = elem.style.get('stroke')
-    color  = str(stroke).strip().lower() if stroke else ""
-    # Normalize shorthand hex: #f00 -> #ff0000
-    if re.match(r'^#[0-9a-f]{3}$', color):
-        color = '#' + ''.join(c*2 for c in color[1:])
-    if color in ('#000000', 'black') or 'rgb(0,0,0)' in color:
-        return "black"
-    if color in ('#00ff00', 'lime', 'green') or 'rgb(0,255,0)' in color:
-        return "green"
-    if color in ('#ffff00', 'yellow') or 'rgb(255,255,0)' in color:
-        return "yellow"
-    if color in ('#ff0000', 'red') or 'rgb(255,0,0)' in color:
-        return "red"
-    return "red"
-
-
-def _simple_tool(elem):
+    job.up(last_tx, last_ty)
+
+
+# ---------------------------------------------------------------------------
+# Path store
+# ---------------------------------------------------------------------------
+
+# PathStore.flags bits
+PATH_CLOSED, PATH_CURVE, PATH_DASHED = 1, 2, 4
+
+
+class PathStore:
+    """All paths of a job, struct-of-arrays.
+
+    Coordinates live in one flat buffer xy = [x0, y0, x1, y1, ...]
+    (array 'd' in mm, or 'i' in plotter units when quantized); path i owns
+    xy[off[i]:off[i+1]]. Per-path settings are parallel lists indexed by
+    path number, the three booleans are bits in flags. Stages work with
+    path indices; pts(i) builds the tuple list of one path only when that
+    path is being cut.
+
+    Instances (clones, repeated shapes) store no points: src[i] names the
+    path whose points they reuse, shifted by (dx[i], dy[i]). For an
+    ordinary path src[i] == i and the shift is 0.
+    """
+
+    __slots__ = ('xy', 'off', 'tool', 'color', 'force', 'speed',
+                 'priority', 'flags', 'src', 'dx', 'dy')
+
+    def __init__(self, typecode='d'):
+        self.xy       = array(typecode)
+        self.off      = array('q', [0])
+        self.tool     = []
+        self.color    = []
+        self.force    = []
+        self.speed    = []
+        self.priority = []
+        self.flags    = bytearray()
+        self.src      = array('q')
+        self.dx       = array(typecode)
+        self.dy       = array(typecode)
+
+    def __len__(self):
+        return len(self.flags)
+
+    def _meta(self, tool, color, force, speed, priority, flags, src, dx, dy):
+        self.off.append(len(self.xy))
+        self.tool.append(tool)
+        self.color.append(color)
+        self.force.append(force)
+        self.speed.append(speed)
+        self.priority.append(priority)
+        self.flags.append(flags)
+        self.src.append(src)
+        self.dx.append(dx)
+        self.dy.append(dy)
+
+    def add(self, pts, tool, color, force, speed, priority,
+            is_closed, has_curve, dashed):
+        xy = self.xy
+        for p in pts:
+            xy.append(p[0]); xy.append(p[1])
+        self._meta(tool, color, force, speed, priority,
+                   (PATH_CLOSED if is_closed else 0) |
+                   (PATH_CURVE if has_curve else 0) |
+                   (PATH_DASHED if dashed else 0),
+                   len(self.flags), 0, 0)
+
+    def add_instance(self, src, dx, dy, tool, color, force, speed, priority, dashed):
+        """Adds a copy of path src shifted by (dx, dy), with its own settings."""
+        src = self.src[src]
+        self._meta(tool, color, force, speed, priority,
+                   (self.flags[src] & (PATH_CLOSED | PATH_CURVE)) |
+                   (PATH_DASHED if dashed else 0),
+                   src, dx, dy)
+
+    def is_closed(self, i):
+        return bool(self.flags[i] & PATH_CLOSED)
+
+    def has_curve(self, i):
+        return bool(self.flags[i] & PATH_CURVE)
+
+    def dashed(self, i):
+        return bool(self.flags[i] & PATH_DASHED)
+
+    def instanced(self):
+        """Set of the paths that have instances."""
+        return {s for i, s in enumerate(self.src) if s != i}
+
+    def n_points(self, i):
+        s = self.src[i]
+        return (self.off[s+1] - self.off[s]) // 2
+
+    def total_points(self):
+        """Stored points (instances not counted)."""
+        return len(self.xy) // 2
+
+    def pts(self, i):
+        """Points of path i as a list of (x, y) tuples."""
+        s = self.src[i]
+        a, b = self.off[s], self.off[s+1]
+        dx = self.dx[i]; dy = self.dy[i]
+        if dx or dy:
+            return [(x + dx, y + dy) for x, y in zip(self.xy[a:b:2], self.xy[a+1:b:2])]
+        return list(zip(self.xy[a:b:2], self.xy[a+1:b:2]))
+
+    def first(self, i):
+        a = self.off[self.src[i]]
+        return (self.xy[a] + self.dx[i], self.xy[a+1] + self.dy[i])
+
+    def centroid(self, i):
+        s = self.src[i]
+        a, b = self.off[s], self.off[s+1]
+        n = (b - a) // 2
+        return (sum(self.xy[a:b:2]) / n + self.dx[i],
+                sum(self.xy[a+1:b:2]) / n + self.dy[i])
+
+    def bbox(self, i):
+        """(min_x, max_x, min_y, max_y) of path i."""
+        s = self.src[i]
+        a, b = self.off[s], self.off[s+1]
+        xs = self.xy[a:b:2]; ys = self.xy[a+1:b:2]
+        dx = self.dx[i]; dy = self.dy[i]
+        return min(xs) + dx, max(xs) + dx, min(ys) + dy, max(ys) + dy
+
+    def bounds_max(self):
+        """(max_x, max_y) over all paths."""
+        mx, my = max(self.xy[0::2]), max(self.xy[1::2])
+        src_bbox = {}
+        for i, s in enumerate(self.src):
+            if s == i:
+                continue
+            if s not in src_bbox:
+                src_bbox[s] = self.bbox(s)
+            bb = src_bbox[s]
+            mx = max(mx, bb[1] + self.dx[i]); my = max(my, bb[3] + self.dy[i])
+        return mx, my
+
+    def contains(self, i, x, y):
+        """Even-odd point-in-polygon test against path i."""
+        s = self.src[i]
+        a, b = self.off[s], self.off[s+1]
+        x -= self.dx[i]; y -= self.dy[i]
+        xy = self.xy
+        inside = False
+        p1x, p1y = xy[a], xy[a+1]
+        for k in range(a+2, b+2, 2):
+            if k == b:
+                k = a
+            p2x, p2y = xy[k], xy[k+1]
+            if p1y == p2y:
+                p1x, p1y = p2x, p2y; continue
+            if not (min(p1y, p2y) < y <= max(p1y, p2y)):
+                p1x, p1y = p2x, p2y; continue
+            xinters = p1x + (y - p1y) * (p2x - p1x) / (p2y - p1y)
+            if x < xinters:
+                inside = not inside
+            p1x, p1y = p2x, p2y
+        return inside
+
+
+# Tool colors; any stroke maps to the nearest one (RGB distance), ties
+# going to red, and strokes further than PALETTE_MAX_DIST from all of
+# them are cut as red.
+PALETTE = (("red",    (255, 0, 0)),
+           ("green",  (0, 255, 0)),
+           ("yellow", (255, 255, 0)),
+           ("black",  (0, 0, 0)))
+PALETTE_MAX_DIST = 160
+
+_color_cache = {}   # stroke value -> color name
+
+
+def _stroke_to_color(stroke):
+    """Returns the color name (black/red/green/yellow) of a stroke value.
+    Any CSS color is understood (names, #rgb, rgb() with spaces or %, hsl());
+    no stroke, 'none', gradients and far-off colors -> 'red' (cut).
+    Memoized per distinct stroke value."""
+    color = _color_cache.get(stroke)
+    if color is not None:
+        return color
+    color = "red"
+    value = str(stroke).strip().lower() if stroke else ""
+    if value and value != "none":
+        try:
+            rgb = inkex.Color(value).to_rgb()
+        except (inkex.colors.ColorError, ValueError):
+            rgb = None
+        if rgb is not None:
+            best = PALETTE_MAX_DIST ** 2 + 1
+            for name, ref in PALETTE:
+                d = sum((a - b) ** 2 for a, b in zip(rgb, ref))
+                if d < best:
+                    color, best = name, d
+    _color_cache[stroke] = color
+    return color
+
+
+def _simple_tool(stroke):
     """Simple mode (like v3): black->P0 (crease), others->P1 (cut)."""
-    color = _stroke_to_color(elem)
+    color = _stroke_to_color(stroke)
     if color == "black":
         return "P0", 0
     if color == "red":
@@ -539,21 +1190,333 @@ def _simple_tool(elem):
     return "P1", 1
 
 
-def process_elements(cut_layer, color_settings, scale_x=1.0, scale_y=1.0):
-    """If color_settings is a dict -> color mode (tool/force/speed/seq per color).
-    If color_settings is None -> simple mode (black=P0, others=P1, no FS/VS)."""
-    path_data = []
-    for elem in cut_layer.iterdescendants():
-        if not isinstance(elem, PathElement):
+# Elements that are cut. Anything else in the Cut layer (text, images...)
+# has to be converted to a path first.
+CUT_SHAPES = (PathElement, Rectangle, Circle, Ellipse, Line, Polyline, Polygon)
+
+_NUMBER = re.compile(r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?')
+
+
+# Attributes that fully define the geometry of each shape (instancing key)
+_GEOMETRY_ATTRS = {
+    'path':     ('d',),
+    'rect':     ('x', 'y', 'width', 'height', 'rx', 'ry'),
+    'circle':   ('cx', 'cy', 'r'),
+    'ellipse':  ('cx', 'cy', 'rx', 'ry'),
+    'line':     ('x1', 'y1', 'x2', 'y2'),
+    'polyline': ('points',),
+    'polygon':  ('points',),
+}
+
+MAX_CLONE_DEPTH = 8         # svg:use pointing at svg:use ...
+
+
+_CLASS_SELECTOR = re.compile(r'^\.(-?[_a-zA-Z][_a-zA-Z0-9-]*)$')
+
+
+class StrokeStyles:
+    """Resolves the stroke and display:none an element sets itself, from
+    (lowest to highest priority) its presentation attributes, the <style>
+    rules for its classes and its style attribute. Only plain class
+    selectors (.name) are read from the stylesheets.
+
+    Results are memoized per distinct (style, class, stroke, display)
+    attribute combination, so the CSS work is paid once per style, not
+    once per element."""
+
+    def __init__(self, svg):
+        self.classes = {}   # class -> {prop: (rule order, value)}
+        order = 0
+        for sheet in svg.stylesheets:
+            for rule in sheet:
+                props = {k: rule[k] for k in ('stroke', 'display') if k in rule}
+                order += 1
+                if not props:
+                    continue
+                for sel in rule.rules:
+                    m = _CLASS_SELECTOR.match(str(sel).strip())
+                    if m:
+                        cls = self.classes.setdefault(m.group(1), {})
+                        cls.update((k, (order, v)) for k, v in props.items())
+        self._cache = {}
+
+    def own(self, node):
+        """(stroke, hidden) set on node; stroke None = inherited."""
+        attrib = node.attrib
+        key = (attrib.get('style'), attrib.get('class'),
+               attrib.get('stroke'), attrib.get('display'))
+        hit = self._cache.get(key)
+        if hit is None:
+            props = {k: v for k, v in (('stroke', key[2]), ('display', key[3]))
+                     if v is not None}
+            ranked = {}
+            for cls in (key[1] or '').split():
+                for k, ov in self.classes.get(cls, {}).items():
+                    if k not in ranked or ov[0] > ranked[k][0]:
+                        ranked[k] = ov
+            props.update((k, v) for k, (_, v) in ranked.items())
+            if key[0]:
+                style = inkex.Style(key[0])
+                props.update((k, style[k]) for k in ('stroke', 'display')
+                             if k in style)
+            stroke = props.get('stroke')
+            if stroke is not None:
+                stroke = stroke.strip()
+                if stroke == 'inherit':
+                    stroke = None
+            hidden = (props.get('display') or '').strip() == 'none'
+            hit = self._cache[key] = (stroke, hidden)
+        return hit
+
+
+def _cut_elements(cut_layer, selected=None):
+    """Yields (elem, transform, stroke) for every shape to cut.
+
+    Walks the Cut layer once, top-down, carrying the absolute transform
+    and the inherited stroke, so each element costs one matrix multiply
+    (none without a transform attribute). display:none subtrees are
+    skipped whole. svg:use clones are followed: the referenced subtree
+    continues with the clone's transform (plus x, y) and stroke.
+    Styles are resolved through StrokeStyles (classes, stylesheets).
+
+    selected: set of element ids, or None for everything. When given, only
+    shapes that are selected themselves, lie inside a selected group, or
+    are shown by a selected clone come out.
+    """
+    styles = StrokeStyles(cut_layer.root)
+    outer = [cut_layer] + list(cut_layer.ancestors())
+    stroke = None
+    for node in outer:
+        stroke = styles.own(node)[0]
+        if stroke is not None:
+            break
+    picked = selected is None or any(n.attrib.get('id') in selected for n in outer)
+    base = cut_layer.composed_transform()
+    stack = [(child, base, stroke, 0, picked) for child in reversed(cut_layer)]
+    while stack:
+        node, transform, stroke, depth, picked = stack.pop()
+        if not isinstance(node, BaseElement):
+            continue            # comments, processing instructions
+        own, hidden = styles.own(node)
+        if hidden:
             continue
+        if not picked and not depth:    # (not by ids inside clone content)
+            picked = node.attrib.get('id') in selected
+        if 'transform' in node.attrib:      # (get() would round it first)
+            transform = transform @ node.transform
+        if own is not None:
+            stroke = own
+        if isinstance(node, CUT_SHAPES):
+            if picked:
+                yield node, transform, stroke
+        elif isinstance(node, Use):
+            ref = node.href
+            if ref is None or depth >= MAX_CLONE_DEPTH:
+                continue
+            x = node.to_dimensionless(node.get('x', 0))
+            y = node.to_dimensionless(node.get('y', 0))
+            if x or y:
+                transform = transform @ Transform(translate=(x, y))
+            stack.append((ref, transform, stroke, depth + 1, picked))
+        else:
+            stack.extend((child, transform, stroke, depth, picked)
+                         for child in reversed(node))
+
+
+def _shape_subpaths(elem, hexad, scale_x, scale_y):
+    """Native fast path for the basic SVG shapes: a list of
+    (pts, is_closed, has_curve), or None when the element has to go
+    through the generic path pipeline (paths, rounded rects)."""
+    if isinstance(elem, PathElement):
+        return None
+    a, b, c, d, e, f = hexad
+
+    def tr(x, y):
+        return ((a*x + c*y + e) * scale_x, (b*x + d*y + f) * scale_y)
+
+    if isinstance(elem, Rectangle):
+        if elem.get('rx') or elem.get('ry'):
+            return None
+        w, h = elem.width, elem.height
+        if w <= 0 or h <= 0:
+            return []
+        x0, y0 = elem.left, elem.top
+        corners = [tr(x0, y0), tr(x0+w, y0), tr(x0+w, y0+h), tr(x0, y0+h)]
+        return [(corners + [corners[0]], True, False)]
+    if isinstance(elem, (Circle, Ellipse)):
+        rx, ry = elem.rxry()
+        if rx <= 0 or ry <= 0:
+            return []
+        center = elem.center
+        return [(sample_ellipse(center.x, center.y, rx, ry, hexad,
+                                scale_x, scale_y, CURVE_STEP_MM), True, True)]
+    if isinstance(elem, Line):
+        return [([tr(elem.x1, elem.y1), tr(elem.x2, elem.y2)], False, False)]
+    # Polyline / Polygon
+    nums = [float(v) for v in _NUMBER.findall(elem.get('points') or '')]
+    pts = [tr(nums[i], nums[i+1]) for i in range(0, len(nums) - 1, 2)]
+    if len(pts) < 2:
+        return []
+    if isinstance(elem, Polygon):
+        if pts[-1] != pts[0]:
+            pts.append(pts[0])
+        return [(pts, True, False)]
+    closed = math.hypot(pts[-1][0]-pts[0][0], pts[-1][1]-pts[0][1]) < 0.01
+    return [(pts, closed, False)]
+
+
+def _path_subpaths(path, hexad, scale_x, scale_y):
+    """Generic pipeline: flattens path (inkex.Path or path data), yields
+    (pts, is_closed, has_curve) per subpath.
+
+    Walks the absolute path segments directly (no CubicSuperPath): lines
+    pass through as they are, cubics and quadratics (raised to cubics,
+    exactly) go through sample_cubic and arcs through ellipse_arc_points.
+    Points come out transformed by hexad and scaled, in mm."""
+    a, b, c, d, e, f = hexad
+    a *= scale_x; c *= scale_x; e *= scale_x
+    b *= scale_y; d *= scale_y; f *= scale_y
+
+    def tr(x, y):
+        return (a*x + c*y + e, b*x + d*y + f)
+
+    step = CURVE_STEP_MM
+    pts = None; has_curve = False
+    sx = sy = x = y = 0.0           # subpath start, current point (user units)
+    ctrl = None                     # last control point, for S / T
+    prev = ''
+    for seg in inkex.Path(path).to_absolute():
+        letter = seg.letter
+        if letter == 'M' or letter == 'Z':
+            if letter == 'Z' and pts is not None:
+                if (x, y) != (sx, sy):
+                    pts.append(tr(sx, sy))
+                x, y = sx, sy
+            if pts is not None and len(pts) >= 2:
+                closed = letter == 'Z' or math.hypot(
+                    pts[-1][0]-pts[0][0], pts[-1][1]-pts[0][1]) < 0.01
+                yield pts, closed, has_curve
+            pts = None
+            if letter == 'M':
+                sx, sy = x, y = seg.x, seg.y
+                pts = [tr(x, y)]; has_curve = False
+            prev = letter
+            continue
+        if pts is None:             # drawing on after Z starts a new subpath
+            pts = [tr(x, y)]; has_curve = False
+
+        if letter == 'L':
+            x, y = seg.x, seg.y
+            pts.append(tr(x, y))
+        elif letter == 'H':
+            x = seg.x
+            pts.append(tr(x, y))
+        elif letter == 'V':
+            y = seg.y
+            pts.append(tr(x, y))
+        elif letter == 'A':
+            x1, y1 = x, y
+            x, y = seg.x, seg.y
+            rx, ry = abs(seg.rx), abs(seg.ry)
+            if (x, y) == (x1, y1):
+                pass
+            elif not rx or not ry:
+                pts.append(tr(x, y))
+            else:
+                cx, cy, rx, ry, th1, dth = _arc_center(
+                    x1, y1, rx, ry, math.radians(seg.x_axis_rotation),
+                    bool(seg.large_arc), bool(seg.sweep), x, y)
+                phi = math.radians(seg.x_axis_rotation)
+                cp = math.cos(phi); sp = math.sin(phi)
+                ux, uy = rx*cp, rx*sp
+                vx, vy = -ry*sp, ry*cp
+                ox, oy = tr(cx, cy)
+                inner = ellipse_arc_points(ox, oy, a*ux + c*uy, b*ux + d*uy,
+                                           a*vx + c*vy, b*vx + d*vy,
+                                           th1, dth, step)
+                if inner:
+                    has_curve = True
+                    pts.extend(inner)
+                pts.append(tr(x, y))
+        else:
+            if letter == 'C':
+                c1 = (seg.x2, seg.y2); c2 = (seg.x3, seg.y3)
+                ctrl = c2; end = (seg.x4, seg.y4)
+            elif letter == 'S':
+                c1 = ((2*x - ctrl[0], 2*y - ctrl[1]) if prev in 'CS'
+                      else (x, y))
+                c2 = (seg.x3, seg.y3)
+                ctrl = c2; end = (seg.x4, seg.y4)
+            else:                   # Q / T: raise to a cubic
+                if letter == 'Q':
+                    q = (seg.x2, seg.y2)
+                else:
+                    q = ((2*x - ctrl[0], 2*y - ctrl[1]) if prev in 'QT'
+                         else (x, y))
+                ctrl = q; end = (seg.x3, seg.y3)
+                c1 = (x + 2/3*(q[0]-x), y + 2/3*(q[1]-y))
+                c2 = (end[0] + 2/3*(q[0]-end[0]), end[1] + 2/3*(q[1]-end[1]))
+            p0 = pts[-1]
+            c1 = tr(*c1); c2 = tr(*c2)
+            x, y = end
+            p1 = tr(x, y)
+            if is_straight(p0, c1, c2, p1):
+                pts.append(p1)
+            else:
+                has_curve = True
+                sample_cubic(pts, p0, c1, c2, p1, step)
+        prev = letter
+
+    if pts is not None and len(pts) >= 2:
+        closed = math.hypot(pts[-1][0]-pts[0][0], pts[-1][1]-pts[0][1]) < 0.01
+        yield pts, closed, has_curve
+
+
+def _flatten_path_data(d, hexad, scale_x, scale_y, quantize):
+    """Worker side of process_elements: subpaths of one svg:path, as
+    (pts, is_closed, has_curve), quantized when asked. Plain data in and
+    out, so it can run in another process."""
+    out = []
+    for pts, sp_closed, has_curve in _path_subpaths(d, hexad, scale_x, scale_y):
+        if quantize:
+            pts = quantize_pts(pts)
+        out.append((pts, sp_closed, has_curve))
+    return out
+
 
+def process_elements(cut_layer, color_settings, scale_x=1.0, scale_y=1.0,
+                     quantize=False, selected=None, region=None, pool=None):
+    """If color_settings is a dict -> color mode (tool/force/speed/seq per color).
+    If color_settings is None -> simple mode (black=P0, others=P1, no FS/VS).
+    quantize=True -> points are stored as integer plotter units (SCALE/mm)
+    right after flattening, instead of float mm.
+
+    Shapes with the same geometry and the same transform up to a
+    translation (svg:use clones, duplicated paths) are flattened once; the
+    repeats become shifted instances in the store.
+
+    selected (element ids) and region ((x0, y0, x1, y1) in mm) narrow the
+    job down before anything is flattened: see _cut_elements, and only
+    shapes whose bounding box touches the region are kept.
+
+    The document is walked first; then svg:path data is flattened through
+    pool (a WorkerPool, in order) while the store is filled in document
+    order, so the result does not depend on the number of workers.
+    Returns a PathStore."""
+    store = PathStore('i' if quantize else 'd')
+    unit  = SCALE if quantize else 1.0
+    items = []    # (settings, key, ex, fy, elem, hexad); elem None = repeat
+    path_data, path_hexads = [], []     # svg:path jobs for the workers
+    seen  = set()
+    boxes = {}    # geometry key -> (bbox in mm, e, f) for the region test
+    for elem, transform, stroke in _cut_elements(cut_layer, selected):
         if color_settings is None:
-            tool, seq = _simple_tool(elem)
+            tool, seq = _simple_tool(stroke)
             force = speed = None
             color = None
             dashed = False
         else:
-            color = _stroke_to_color(elem)
+            color = _stroke_to_color(stroke)
             cfg   = color_settings.get(color, color_settings['red'])
             tool  = cfg['tool']
             seq   = cfg['seq']
@@ -561,126 +1524,156 @@ def process_elements(cut_layer, color_settings, scale_x=1.0, scale_y=1.0):
             speed = cfg['speed']
             dashed = cfg.get('dashed', False)
 
-        abs_path = elem.path.to_absolute()
-        composed = elem.composed_transform()
-        if composed:
-            abs_path = abs_path.transform(composed)
-        elif elem.transform:
-            abs_path = abs_path.transform(elem.transform)
-
-        has_zone_close = any(isinstance(s, ZoneClose) for s in abs_path)
-        csp = CubicSuperPath(abs_path)
-
-        for subpath in csp:
-            if len(subpath) < 2:
+        hexad = transform.to_hexad()
+        key = (elem.TAG, hexad[:4]) + tuple(elem.get(a) for a in _GEOMETRY_ATTRS[elem.TAG])
+        if region is not None:
+            box = boxes.get(key)
+            if box is None:
+                bb = elem.path.to_absolute().transform(transform).bounding_box()
+                box = boxes[key] = (bb and (bb.left*scale_x, bb.top*scale_y,
+                                            bb.right*scale_x, bb.bottom*scale_y),
+                                    hexad[4], hexad[5])
+            bb, e0, f0 = box
+            if bb is None:
                 continue
-            pts = []; has_curve = False
-            for i in range(1, len(subpath)):
-                p0 = (subpath[i-1][1][0]*scale_x, subpath[i-1][1][1]*scale_y)
-                c1 = (subpath[i-1][2][0]*scale_x, subpath[i-1][2][1]*scale_y)
-                c2 = (subpath[i][0][0]  *scale_x, subpath[i][0][1]  *scale_y)
-                p1 = (subpath[i][1][0]  *scale_x, subpath[i][1][1]  *scale_y)
-                if is_straight(p0, c1, c2, p1):
-                    pts.append(p0)
-                else:
-                    has_curve = True
-                    for s in range(STEPS_PER_SEG):
-                        pts.append(cubic_point(p0, c1, c2, p1, s/STEPS_PER_SEG))
-            pts.append((subpath[-1][1][0]*scale_x, subpath[-1][1][1]*scale_y))
-
-            if has_curve:
-                pts = resample_by_length(pts, CURVE_STEP_MM)
+            sx = (hexad[4] - e0) * scale_x; sy = (hexad[5] - f0) * scale_y
+            if (bb[2] + sx < region[0] or bb[0] + sx > region[2] or
+                    bb[3] + sy < region[1] or bb[1] + sy > region[3]):
+                continue
+        settings = (tool, color, force, speed, seq, dashed)
+        ex = hexad[4] * scale_x * unit
+        fy = hexad[5] * scale_y * unit
+        if key in seen:
+            items.append((settings, key, ex, fy, None, None))
+            continue
+        seen.add(key)
+        if isinstance(elem, PathElement):
+            path_data.append(elem.get('d') or '')
+            path_hexads.append(hexad)
+        items.append((settings, key, ex, fy, elem, hexad))
+
+    flatten = partial(_flatten_path_data, scale_x=scale_x, scale_y=scale_y,
+                      quantize=quantize)
+    flattened = (pool or WorkerPool(1)).map(flatten, path_data, path_hexads)
+    shapes = {}   # geometry key -> [(store index, x shift, y shift)]
+    for (tool, color, force, speed, seq, dashed), key, ex, fy, elem, hexad in items:
+        if elem is None:
+            for src, ex0, fy0 in shapes[key]:
+                dx = ex - ex0; dy = fy - fy0
+                if quantize:
+                    dx = round(dx); dy = round(dy)
+                store.add_instance(src, dx, dy, tool, color, force, speed, seq, dashed)
+            continue
+        known = shapes[key] = []
 
-            # Determine closure: ZoneClose in path, or start/end proximity
-            sp_closed = has_zone_close
-            if not sp_closed and len(pts) >= 2:
-                sp_closed = math.hypot(pts[-1][0]-pts[0][0], pts[-1][1]-pts[0][1]) < 0.01
+        if isinstance(elem, PathElement):
+            subpaths = next(flattened)
+        else:
+            subpaths = _shape_subpaths(elem, hexad, scale_x, scale_y)
+            if subpaths is None:        # rounded rect
+                subpaths = _path_subpaths(elem.path, hexad, scale_x, scale_y)
+            if quantize:
+                subpaths = [(quantize_pts(pts), c, h) for pts, c, h in subpaths]
 
+        for pts, sp_closed, has_curve in subpaths:
             if pts:
-                path_data.append({
-                    'pts':       pts,
-                    'tool':      tool,
-                    'color':     color,
-                    'force':     force,
-                    'speed':     speed,
-                    'priority':  seq,
-                    'is_closed': sp_closed,
-                    'has_curve': has_curve,
-                    'dashed':    dashed,
-                })
-    return path_data
+                known.append((len(store), ex, fy))
+                store.add(pts, tool, color, force, speed, seq,
+                          sp_closed, has_curve, dashed)
+    return store
 
 
 # ---------------------------------------------------------------------------
 # Nesting / Route optimisation
 # ---------------------------------------------------------------------------
 
-def point_in_polygon(point, poly):
-    x, y = point
-    inside = False
-    n = len(poly)
-    p1x, p1y = poly[0]
-    for i in range(1, n + 1):
-        p2x, p2y = poly[i % n]
-        if p1y == p2y:
-            p1x, p1y = p2x, p2y; continue
-        if not (min(p1y, p2y) < y <= max(p1y, p2y)):
-            p1x, p1y = p2x, p2y; continue
-        xinters = p1x + (y - p1y) * (p2x - p1x) / (p2y - p1y)
-        if x < xinters:
-            inside = not inside
-        p1x, p1y = p2x, p2y
-    return inside
-
-
-def _build_spatial_cache(paths):
-    n = len(paths)
+# The nesting functions work on one priority group: ids is the list of
+# its path indices in the PathStore, and the results (depths, centroids,
+# islands) are indexed by position in ids.
+
+def _build_spatial_cache(store, ids):
+    n = len(ids)
     centroids = [None] * n
     bboxes    = [None] * n
     for i in range(n):
-        if not paths[i]['is_closed']:
+        if not store.is_closed(ids[i]):
             continue
-        poly = paths[i]['pts']
-        cx = sum(p[0] for p in poly) / len(poly)
-        cy = sum(p[1] for p in poly) / len(poly)
-        centroids[i] = (cx, cy)
-        bboxes[i] = (min(p[0] for p in poly), max(p[0] for p in poly),
-                     min(p[1] for p in poly), max(p[1] for p in poly))
+        centroids[i] = store.centroid(ids[i])
+        bboxes[i] = store.bbox(ids[i])
     return centroids, bboxes
 
 
-def compute_depths(paths):
-    n = len(paths)
-    depths = [0 if paths[i]['is_closed'] else -1 for i in range(n)]
-    centroids, bboxes = _build_spatial_cache(paths)
+class BoxGrid:
+    """Uniform grid over bounding boxes (min_x, max_x, min_y, max_y; None
+    entries are left out), about one box per cell. at(x, y) lists the
+    positions of the boxes holding the point, in ascending order, without
+    a scan of all boxes."""
+
+    def __init__(self, bboxes):
+        self.bboxes = bboxes
+        self.cells  = {}
+        live = [k for k, bb in enumerate(bboxes) if bb is not None]
+        if not live:
+            self.x0 = self.y0 = 0.0; self.cell = 1.0
+            return
+        self.x0 = min(bboxes[k][0] for k in live)
+        self.y0 = min(bboxes[k][2] for k in live)
+        w = max(bboxes[k][1] for k in live) - self.x0
+        h = max(bboxes[k][3] for k in live) - self.y0
+        self.cell = math.sqrt(w * h / len(live)) or max(w, h) or 1.0
+        for k in live:
+            mnx, mxx, mny, mxy = bboxes[k]
+            ix0, iy0 = self._key(mnx, mny)
+            ix1, iy1 = self._key(mxx, mxy)
+            for ix in range(ix0, ix1 + 1):
+                for iy in range(iy0, iy1 + 1):
+                    self.cells.setdefault((ix, iy), []).append(k)
+
+    def _key(self, x, y):
+        return int((x - self.x0) // self.cell), int((y - self.y0) // self.cell)
+
+    def at(self, x, y):
+        bboxes = self.bboxes
+        return [k for k in self.cells.get(self._key(x, y), ())
+                if bboxes[k][0] <= x <= bboxes[k][1] and bboxes[k][2] <= y <= bboxes[k][3]]
+
+
+def compute_depths(store, ids):
+    """Nesting depth of each path of ids: the number of other closed paths
+    that hold its centroid (-1 for open paths).
+
+    Known limitation: a ring-shaped outline whose centroid falls inside
+    the hole, like the outer contour of an 'o' around its concentric
+    counter, is counted as inside the hole. Both contours then get depth
+    1, and the outer one is not kept after its counter."""
+    n = len(ids)
+    depths = [0 if store.is_closed(ids[i]) else -1 for i in range(n)]
+    centroids, bboxes = _build_spatial_cache(store, ids)
+    grid = BoxGrid(bboxes)
     for i in range(n):
         if depths[i] == -1:
             continue
         cx, cy = centroids[i]
         count = 0
-        for j in range(n):
-            if i == j or bboxes[j] is None:
-                continue
-            mnx, mxx, mny, mxy = bboxes[j]
-            if cx < mnx or cx > mxx or cy < mny or cy > mxy:
-                continue
-            if point_in_polygon((cx, cy), paths[j]['pts']):
+        for j in grid.at(cx, cy):
+            if i != j and store.contains(ids[j], cx, cy):
                 count += 1
         depths[i] = count
     return depths, centroids
 
 
-def group_into_islands(paths, depths, centroids):
+def group_into_islands(store, ids, depths, centroids):
     closed_indices = [i for i, d in enumerate(depths) if d >= 0]
-    root_set = [i for i in closed_indices if depths[i] == 0]
+    root_grid = BoxGrid([store.bbox(ids[i]) if d == 0 else None
+                         for i, d in enumerate(depths)])
     roots = {}
     for i in closed_indices:
         if depths[i] == 0:
             roots[i] = i
         else:
             cx, cy = centroids[i]
-            for j in root_set:
-                if point_in_polygon((cx, cy), paths[j]['pts']):
+            for j in root_grid.at(cx, cy):
+                if store.contains(ids[j], cx, cy):
                     roots[i] = j; break
             else:
                 roots[i] = i
@@ -694,7 +1687,8 @@ def group_into_islands(paths, depths, centroids):
     return list(island_dict.values())
 
 
-def sort_island_paths(island_idx_list, paths, depths, nesting_order):
+def sort_island_paths(island_idx_list, store, ids, depths, nesting_order, stats=None,
+                      cluster_size=0, pool=None, seed='auto', budget=0.0):
     closed    = [i for i in island_idx_list if depths[i] >= 0]
     open_pths = [i for i in island_idx_list if depths[i] == -1]
     groups = {}
@@ -704,10 +1698,10 @@ def sort_island_paths(island_idx_list, paths, depths, nesting_order):
     for d in sorted(groups.keys(), reverse=(nesting_order == 'inside_first')):
         grp = groups[d]
         if len(grp) > 1:
-            items = nearest_neighbor_sort(grp, lambda i: paths[i]['pts'][0])
-            if len(items) > 3:
-                items = two_opt(items, lambda i: paths[i]['pts'][0])
-            result.extend(items)
+            order = route_points([store.first(ids[i]) for i in grp],
+                                 cluster_size, pool, stats, seed,
+                                 budget * len(grp) / len(ids))
+            result.extend(grp[k] for k in order)
         else:
             result.extend(grp)
     result.extend(open_pths)
@@ -728,7 +1722,10 @@ def nearest_neighbor_sort(items, key_fn):
     return result
 
 
-def two_opt(items, key_fn):
+def two_opt(items, key_fn, stats=None, keep_last=False):
+    """2-opt improvement of the tour through key_fn(item) points. The
+    first item stays first (and the last stays last with keep_last).
+    stats (JobStats, optional) counts passes and segment reversals."""
     if len(items) <= 3:
         return items
     pts   = [key_fn(it) for it in items]
@@ -739,11 +1736,13 @@ def two_opt(items, key_fn):
         pa, pb = pts[a], pts[b]
         return math.hypot(pa[0]-pb[0], pa[1]-pb[1])
 
+    passes = moves = 0
     improved = True
     while improved:
         improved = False
+        passes += 1
         for i in range(1, n - 1):
-            for j in range(i + 1, n):
+            for j in range(i + 1, n - 1 if keep_last else n):
                 a, b    = order[i-1], order[i]
                 c       = order[j]
                 d_next  = order[j+1] if j+1 < n else None
@@ -752,9 +1751,864 @@ def two_opt(items, key_fn):
                 if new < old - 0.001:
                     order[i:j+1] = order[i:j+1][::-1]
                     improved = True
+                    moves += 1
+    if stats is not None:
+        stats.count('two_opt_runs')
+        stats.count('two_opt_passes', passes)
+        stats.count('two_opt_moves', moves)
     return [items[k] for k in order]
 
 
+def hilbert_order(pts, idx):
+    """idx (indices into pts) sorted along a Hilbert curve laid over the
+    bounding box of the points, on a 2^16 x 2^16 grid. O(n log n)."""
+    if not idx:
+        return []
+    x0 = min(pts[i][0] for i in idx); y0 = min(pts[i][1] for i in idx)
+    span = max(max(pts[i][0] for i in idx) - x0,
+               max(pts[i][1] for i in idx) - y0) or 1.0
+    side = 1 << 16
+    k = (side - 1) / span
+
+    def key(i):
+        x = int((pts[i][0] - x0) * k); y = int((pts[i][1] - y0) * k)
+        d = 0
+        s = side >> 1
+        while s:
+            rx = 1 if x & s else 0
+            ry = 1 if y & s else 0
+            d += s * s * ((3 * rx) ^ ry)
+            if not ry:
+                if rx:
+                    x = side - 1 - x; y = side - 1 - y
+                x, y = y, x
+            s >>= 1
+        return d
+    return sorted(idx, key=lambda i: (key(i), i))
+
+
+def tour_length(pts, order):
+    return sum(math.hypot(pts[a][0]-pts[b][0], pts[a][1]-pts[b][1])
+               for a, b in zip(order, order[1:]))
+
+
+def neighbor_lists(pts, k=NEIGHBORS):
+    """The k nearest other points of every point (indices, nearest
+    first), through a uniform grid of about two points per cell."""
+    n = len(pts)
+    k = min(k, n - 1)
+    x0 = min(p[0] for p in pts); y0 = min(p[1] for p in pts)
+    w = max(p[0] for p in pts) - x0; h = max(p[1] for p in pts) - y0
+    cell = math.sqrt(2.0 * w * h / n) or max(w, h) / n or 1.0
+    grid = {}
+    for i, (x, y) in enumerate(pts):
+        grid.setdefault((int((x - x0) // cell), int((y - y0) // cell)), []).append(i)
+    nbrs = []
+    for i, (x, y) in enumerate(pts):
+        gx, gy = int((x - x0) // cell), int((y - y0) // cell)
+        found = []
+        r = 0
+        # Points outside rings 0..r are farther than r * cell
+        while True:
+            for ix in range(gx - r, gx + r + 1):
+                for iy in (range(gy - r, gy + r + 1) if ix in (gx - r, gx + r)
+                           else (gy - r, gy + r)):
+                    for j in grid.get((ix, iy), ()):
+                        if j != i:
+                            found.append((math.hypot(pts[j][0]-x, pts[j][1]-y), j))
+            if len(found) >= k:
+                found.sort()
+                if found[k-1][0] <= r * cell:
+                    break
+            r += 1
+        nbrs.append([j for _, j in found[:k]])
+    return nbrs
+
+
+# Clock improve_tour() spends its budget on. The golden check swaps in a
+# counter that steps on every call, so a budgeted route stops at the same
+# move on any machine.
+ROUTE_CLOCK = time.perf_counter
+
+
+def improve_tour(pts, order, budget, keep_last=False, stats=None):
+    """Anytime local search on an open tour (order: indices into pts)
+    for up to budget seconds. Moves, tried only towards the NEIGHBORS
+    nearest points of each point:
+      * Or-opt: a chain of 1-3 points moved elsewhere, either way round
+        (the restricted, segment-insertion kind of 3-opt move);
+      * 2-opt: a segment reversed.
+    Only improving moves are made, so the tour in hand is always the
+    best one found. The first point (and the last, with keep_last) stays
+    put. Stops at the budget or when no move improves."""
+    n = len(order)
+    if n < 4 or budget <= 0:
+        return order
+    deadline = ROUTE_CLOCK() + budget
+    order = list(order)
+    nbrs = neighbor_lists(pts)
+    pos = [0] * len(pts)
+    for k, c in enumerate(order):
+        pos[c] = k
+
+    def d(a, b):
+        if a is None or b is None:
+            return 0.0
+        pa, pb = pts[a], pts[b]
+        return math.hypot(pa[0]-pb[0], pa[1]-pb[1])
+
+    def at(k):
+        return order[k] if k < n else None
+
+    moves_or = moves_2 = 0
+    improved = True
+    while improved:
+        improved = False
+        for i in range(1, n):
+            if ROUTE_CLOCK() > deadline:
+                improved = False
+                break
+            # Or-opt: order[i..j] between order[k] and order[k+1]
+            for j in range(i, min(i + 3, n - 1 if keep_last else n)):
+                s0, s1 = order[i], order[j]
+                p, q = order[i-1], at(j+1)
+                gain = d(p, s0) + d(s1, q) - (d(p, q) if q is not None else 0.0)
+                best = None
+                for c in nbrs[s0] + nbrs[s1]:
+                    for k in (pos[c] - 1, pos[c]):
+                        if k < 0 or i - 1 <= k <= j or (keep_last and k == n - 1):
+                            continue
+                        a, b = order[k], at(k+1)
+                        base = d(a, b) if b is not None else 0.0
+                        for rev in (False, True):
+                            x, y = (s1, s0) if rev else (s0, s1)
+                            delta = d(a, x) + d(y, b) - base - gain
+                            if delta < -0.001 and (best is None or delta < best[0]):
+                                best = (delta, k, rev)
+                if best is not None:
+                    _, k, rev = best
+                    seg = order[i:j+1]
+                    if rev:
+                        seg.reverse()
+                    if k < i:
+                        order[k+1:j+1] = seg + order[k+1:i]
+                        lo, hi = k + 1, j + 1
+                    else:
+                        order[i:k+1] = order[j+1:k+1] + seg
+                        lo, hi = i, k + 1
+                    for m in range(lo, hi):
+                        pos[order[m]] = m
+                    moves_or += 1
+                    improved = True
+                    break
+            # 2-opt: reverse so that order[i-1] is followed by a neighbor
+            a, b = order[i-1], order[i]
+            for c in nbrs[a]:
+                j = pos[c]
+                if j > i:
+                    if keep_last and j == n - 1:
+                        continue
+                    e = at(j+1)
+                    delta = d(a, c) + d(b, e) - d(a, b) - d(c, e)
+                    lo, hi = i, j + 1
+                elif j < i - 1:
+                    c2 = order[j+1]
+                    delta = d(c, a) + d(c2, b) - d(c, c2) - d(a, b)
+                    lo, hi = j + 1, i
+                else:
+                    continue
+                if delta < -0.001:
+                    order[lo:hi] = order[lo:hi][::-1]
+                    for m in range(lo, hi):
+                        pos[order[m]] = m
+                    moves_2 += 1
+                    improved = True
+                    break
+    if stats is not None:
+        stats.count('anytime_or_moves', moves_or)
+        stats.count('anytime_2opt_moves', moves_2)
+    return order
+
+
+def solve_tour(pts, last=None, stats=None, seed='auto', budget=0.0):
+    """Visiting order (indices into pts) of an open tour from pts[0]
+    (and ending at pts[last], if given), improved by 2-opt. The first
+    tour is nearest neighbor (O(n^2)) or, for seed 'hilbert' or 'auto'
+    above HILBERT_MIN points, the Hilbert curve order (O(n log n)),
+    entered at pts[0]. The curve tour is longer, but ready at once.
+    With a budget (seconds), improve_tour() then goes on from there."""
+    fixed_end = last is not None and last != 0
+    rest = [k for k in range(len(pts)) if k != last] if fixed_end else list(range(len(pts)))
+    if seed == 'hilbert' or (seed == 'auto' and len(pts) > HILBERT_MIN):
+        order = hilbert_order(pts, rest)
+        start = order.index(0)
+        order = order[start:] + order[:start]
+        if stats is not None:
+            stats.count('hilbert_seeds')
+    else:
+        order = nearest_neighbor_sort(rest, pts.__getitem__)
+    if fixed_end:
+        order.append(last)
+    if len(order) > 3:
+        order = two_opt(order, pts.__getitem__, stats, keep_last=fixed_end)
+    if budget > 0 and len(order) > 3:
+        before = tour_length(pts, order)
+        order = improve_tour(pts, order, budget, fixed_end, stats)
+        if stats is not None:
+            stats.count('route_length_2opt', before)
+            stats.count('route_length_final', tour_length(pts, order))
+    return order
+
+
+def _solve_counted(pts, last, budget, seed='auto'):
+    """solve_tour() for WorkerPool: returns (order, counters)."""
+    st = JobStats(True)
+    return solve_tour(pts, last, st, seed, budget), st.counters
+
+
+def split_clusters(pts, size):
+    """Cuts the indices of pts into spatial clusters of at most size
+    points: each part is halved at the median of the longer side of its
+    bounding box, recursively (O(n log n)). Returns the clusters in
+    split order."""
+    clusters = []
+    stack = [list(range(len(pts)))]
+    while stack:
+        idx = stack.pop()
+        if len(idx) <= size:
+            clusters.append(idx)
+            continue
+        xs = [pts[i][0] for i in idx]
+        ys = [pts[i][1] for i in idx]
+        axis = 0 if max(xs) - min(xs) >= max(ys) - min(ys) else 1
+        idx.sort(key=lambda i: (pts[i][axis], i))
+        half = len(idx) // 2
+        stack.append(idx[half:])
+        stack.append(idx[:half])
+    return clusters
+
+
+def route_points(pts, cluster_size=0, pool=None, stats=None, seed='auto',
+                 budget=0.0):
+    """Visiting order (indices into pts) of an open tour from pts[0].
+
+    Up to cluster_size points (or always, when 0): solve_tour(). Beyond
+    that the points are split into clusters (split_clusters) and the
+    clusters put in order by a tour over their centroids. Each cluster
+    is then solved on its own (through the pool's workers if given),
+    from its point nearest the previous cluster's exit to its point
+    nearest the next cluster's centroid. Last, 2-opt runs again on
+    SEAM_WINDOW points each side of every seam. Cost is about
+    n * cluster_size instead of n^2. seed: first tour; budget: seconds
+    for improve_tour(), shared out by cluster size (see solve_tour)."""
+    n = len(pts)
+    if not cluster_size or n <= cluster_size:
+        return solve_tour(pts, stats=stats, seed=seed, budget=budget)
+    clusters = split_clusters(pts, cluster_size)
+    # Start where the unclustered tour would: the cluster of pts[0],
+    # from pts[0]
+    home = next(k for k, c in enumerate(clusters) if 0 in c)
+    clusters.insert(0, clusters.pop(home))
+    clusters[0].remove(0)
+    clusters[0].insert(0, 0)
+    centroids = [(sum(pts[i][0] for i in c) / len(c), sum(pts[i][1] for i in c) / len(c))
+                 for c in clusters]
+    tour = solve_tour(centroids, seed=seed)
+    clusters  = [clusters[k] for k in tour]
+    centroids = [centroids[k] for k in tour]
+    if stats is not None:
+        stats.count('route_clusters', len(clusters))
+
+    def nearest(c, p):
+        return min(range(len(c)), key=lambda k: math.hypot(pts[c[k]][0]-p[0],
+                                                           pts[c[k]][1]-p[1]))
+
+    # Exit: nearest the next centroid; entry: nearest the previous exit
+    lasts = []
+    for k, c in enumerate(clusters):
+        if k:
+            entry = nearest(c, pts[clusters[k-1][lasts[-1]]])
+            c[0], c[entry] = c[entry], c[0]
+        lasts.append(nearest(c, centroids[k+1]) if k + 1 < len(clusters) else None)
+    cluster_pts = [[pts[i] for i in c] for c in clusters]
+    budgets = [budget * len(c) / n for c in clusters]
+    solve = partial(_solve_counted, seed=seed)
+    if pool is not None:
+        tours = pool.map(solve, cluster_pts, lasts, budgets, work=n)
+    else:
+        tours = map(solve, cluster_pts, lasts, budgets)
+    order, seams = [], []
+    for c, (t, counters) in zip(clusters, tours):
+        if stats is not None:
+            for name, v in counters.items():
+                stats.count(name, v)
+        seams.append(len(order))
+        order.extend(c[k] for k in t)
+    # Both ends of each window stay put, so the rest of the tour is
+    # not affected
+    for s in seams[1:]:
+        lo, hi = max(0, s - SEAM_WINDOW), min(n, s + SEAM_WINDOW)
+        order[lo:hi] = two_opt(order[lo:hi], pts.__getitem__, stats,
+                               keep_last=hi < n)
+    return order
+
+
+def route_group(store, group, auto_nesting=True, nesting_order='inside_first',
+                timed=False, cluster_size=0, pool=None, seed='auto', budget=0.0):
+    """Cutting order of one priority group (store path indices).
+
+    Returns (units, JobStats report): units are the islands (or single
+    paths) in tour order, each a list of path indices in cutting order.
+    The tour can be run backwards unit by unit without breaking the
+    nesting order. Groups do not depend on each other, so WorkerPool can
+    route them at the same time; the caller then picks where each group's
+    tour starts, and its direction, from where the previous one ends. Tours longer than
+    cluster_size are routed in clusters (see route_points), through
+    pool if given; seed picks the first tour. budget: seconds for the
+    whole job, of which the group gets its share by path count, for
+    improve_tour() on each tour (see solve_tour); the report then always
+    holds the route_length_* counters."""
+    st = JobStats(timed or budget > 0)
+    budget *= len(group) / len(store)
+    if auto_nesting and any(store.is_closed(i) for i in group):
+        with st.stage('compute_depths', len(group)):
+            depths, centroids = compute_depths(store, group)
+        with st.stage('group_into_islands', len(group)) as rec:
+            islands = group_into_islands(store, group, depths, centroids)
+            rec['out'] = len(islands)
+        ordered_islands = []
+        with st.stage('sort_island_paths', len(group)):
+            for island_idx_list in islands:
+                ordered_idx = sort_island_paths(island_idx_list, store, group,
+                                                depths, nesting_order, st,
+                                                cluster_size, pool, seed, budget)
+                ordered_islands.append(ordered_idx)
+        # Route islands by their first points
+        with st.stage('route_islands', len(ordered_islands)):
+            order = route_points([store.first(group[isl[0]]) for isl in ordered_islands],
+                                 cluster_size, pool, st, seed,
+                                 budget * len(ordered_islands) / len(group))
+        units = [[group[idx] for idx in ordered_islands[k]] for k in order]
+    else:
+        with st.stage('route_paths', len(group)):
+            order = route_points([store.first(i) for i in group],
+                                 cluster_size, pool, st, seed, budget)
+        units = [[group[k]] for k in order]
+    return units, st.report()
+
+
+def orient_groups(tours, ends, home=None):
+    """Direction of each group tour (lists of units, see route_group) that
+    minimizes the travel from home through the groups, in order, and back
+    to home (no home: from the first group to the last). ends(i) gives
+    the (start, exit) points of path i as cut. Paths are not reversible,
+    so a tour run backwards can also be longer inside; both directions
+    are measured. Two states per group, so a small DP. Returns one flag
+    per tour, True = run it backwards; ties keep the forward direction."""
+    def dist(a, b):
+        return math.hypot(a[0]-b[0], a[1]-b[1]) if a and b else 0.0
+
+    # best: (travel so far, exit point, flags), one per direction of the
+    # last tour placed
+    best = [(0.0, home, [])]
+    for units in tours:
+        nxt = []
+        for rev in ((False, True) if len(units) > 1 else (False,)):
+            seq = units[::-1] if rev else units
+            inner = sum(dist(ends(a[-1])[1], ends(b[0])[0])
+                        for a, b in zip(seq, seq[1:]))
+            start = ends(seq[0][0])[0]
+            cost, _, flags = min(((c + dist(ex, start), ex, f) for c, ex, f in best),
+                                 key=lambda c: c[0])
+            nxt.append((cost + inner, ends(seq[-1][-1])[1], flags + [rev]))
+        best = nxt
+    return min(best, key=lambda c: c[0] + dist(c[1], home))[2]
+
+
+def join_groups(tours, ends, home=None):
+    """Start and direction of each group tour (lists of units, see
+    route_group), group after group: the tour is closed into a cycle and
+    opened again at the unit, and run in the direction, that needs the
+    least travel from where the previous group ends (from home for the
+    first group, and back to home after the last) through the tour. Units
+    keep their inner order, so nesting is kept. Greedy, so it cannot see
+    the groups still to come: when the orient_groups() directions on the
+    tours as routed give less travel overall, those are used instead.
+    ends(i) gives the (start, exit) points of path i as cut.
+
+    Returns the tours in cutting order (new lists) and one (reversed,
+    shift) pair per tour: shift is the unit the tour now starts at,
+    counted in the direction it runs."""
+    def dist(a, b):
+        return math.hypot(a[0]-b[0], a[1]-b[1]) if a and b else 0.0
+
+    def travel(seqs):
+        total = 0.0; at = home
+        for seq in seqs:
+            for unit in seq:
+                st, ex = ends(unit[0])[0], ends(unit[-1])[1]
+                total += dist(at, st)
+                at = ex
+        return total + dist(at, home)
+
+    greedy = []; flags = []
+    at = home
+    for g, units in enumerate(tours):
+        n = len(units)
+        if n == 0:
+            greedy.append([]); flags.append((False, 0))
+            continue
+        back = home if g == len(tours) - 1 else None
+        best = None
+        for rev in ((False, True) if n > 1 else (False,)):
+            seq = units[::-1] if rev else units
+            starts = [ends(u[0])[0] for u in seq]
+            exits  = [ends(u[-1])[1] for u in seq]
+            # gaps[k]: from unit k to unit k+1, around the cycle
+            gaps = [dist(exits[k], starts[(k + 1) % n]) for k in range(n)]
+            cycle = sum(gaps)
+            for r in range(n):
+                cost = (dist(at, starts[r]) + cycle - gaps[r-1]
+                        + dist(exits[r-1], back))
+                if best is None or cost < best[0] - 1e-9:
+                    best = (cost, rev, r)
+        _, rev, r = best
+        seq = units[::-1] if rev else units
+        seq = seq[r:] + seq[:r]
+        greedy.append(seq); flags.append((rev, r))
+        at = ends(seq[-1][-1])[1]
+
+    reverse = orient_groups(tours, ends, home)
+    oriented = [units[::-1] if rev else list(units) for units, rev in zip(tours, reverse)]
+    if travel(oriented) < travel(greedy) - 1e-9:
+        return oriented, [(rev, 0) for rev in reverse]
+    return greedy, flags
+
+
+def split_by_settings(groups, key):
+    """Splits each priority group (list of path indices) into runs of
+    paths with the same key(i) (tool, force, speed), for the fewest tool
+    and pressure changes the sequence numbers allow. Within a group the
+    runs go: creasing (P0) before cutting, then the settings the previous
+    group ended with, then the rest, and last any settings the next group
+    also has. Returns the runs, in order."""
+    runs_out = []
+    prev = None
+    for g, group in enumerate(groups):
+        runs = {}
+        for i in group:
+            runs.setdefault(key(i), []).append(i)
+        nxt = {key(i) for i in groups[g+1]} if g + 1 < len(groups) else set()
+        order = sorted(runs, key=lambda k: (k[0] != "P0", k != prev, k in nxt, k))
+        runs_out.extend(runs[k] for k in order)
+        prev = order[-1]
+    return runs_out
+
+
+# ---------------------------------------------------------------------------
+# Cut-time estimate
+# ---------------------------------------------------------------------------
+
+VS_MM_PER_SEC = 50          # VS<n> = n * 50 mm/s (see COMMANDS.md)
+
+
+def _move_time(length, speed, accel):
+    """Trapezoidal profile: accelerate, cruise at speed, decelerate to 0.
+    Short moves never reach speed (triangular profile)."""
+    if length <= 0 or speed <= 0:
+        return 0.0
+    if accel <= 0:
+        return length / speed
+    if length >= speed * speed / accel:
+        return length / speed + speed / accel
+    return 2.0 * math.sqrt(length / accel)
+
+
+def estimate_cut_time(commands, cut_speed=350.0, travel_speed=350.0,
+                      accel=2000.0, corner_deg=30.0, pen_time=0.05,
+                      tool_change_time=1.5):
+    """Predicts the job duration from the emitted HPGL.
+
+    commands      - an HpglJob, or HPGL text / a list of commands
+    cut_speed     - mm/s when no VS is sent (simple mode: machine setting)
+    travel_speed  - mm/s for pen-up moves until a US is sent
+    accel         - mm/s^2; every run of moves starts and ends at rest
+    corner_deg    - a turn sharper than this stops the head (new run)
+    pen_time      - seconds per blade lift / drop
+    tool_change_time - seconds per P0 <-> P1 switch
+
+    Returns a dict with the time breakdown (seconds) and the distances (mm).
+    """
+    if isinstance(commands, HpglJob):
+        job = commands
+    else:
+        job = HpglJob.from_text(commands if isinstance(commands, str)
+                                else "".join(commands))
+    cos_corner = math.cos(math.radians(corner_deg))
+    v_cut, v_travel = cut_speed, travel_speed
+    x = y = 0
+    pen = OP_UP
+    tool = None
+    run_kind = None; run_len = 0.0; run_dir = None
+    res = {'cut_s': 0.0, 'travel_s': 0.0, 'pen_s': 0.0, 'tool_change_s': 0.0,
+           'cut_mm': 0.0, 'travel_mm': 0.0, 'pen_lifts': 0, 'tool_changes': 0}
+
+    def close_run():
+        nonlocal run_kind, run_len, run_dir
+        if run_kind == OP_DOWN:
+            res['cut_s'] += _move_time(run_len, v_cut, accel)
+        elif run_kind == OP_UP:
+            res['travel_s'] += _move_time(run_len, v_travel, accel)
+        run_kind = None; run_len = 0.0; run_dir = None
+
+    for op, a, b in job.ops_iter():
+        if op == OP_UP or op == OP_DOWN:
+            if op != pen:
+                close_run()
+                res['pen_s'] += pen_time
+                if op == OP_UP:
+                    res['pen_lifts'] += 1
+                pen = op
+            dx = (a - x) / SCALE; dy = (b - y) / SCALE
+            d = math.hypot(dx, dy)
+            x, y = a, b
+            if d < 1e-9:
+                continue
+            cur = (dx / d, dy / d)
+            if run_dir is not None and cur[0]*run_dir[0] + cur[1]*run_dir[1] < cos_corner:
+                close_run()
+            run_kind = op; run_len += d; run_dir = cur
+            res['cut_mm' if op == OP_DOWN else 'travel_mm'] += d
+        elif op == OP_TOOL:
+            if tool is not None and a != tool:
+                res['tool_changes'] += 1
+                res['tool_change_s'] += tool_change_time
+            tool = a
+        elif op == OP_VS:
+            close_run()
+            v_cut = a * VS_MM_PER_SEC if a > 0 else cut_speed
+        elif op == OP_US:
+            close_run()
+            v_travel = a if a > 0 else travel_speed
+    close_run()
+    res['total_s'] = (res['cut_s'] + res['travel_s'] + res['pen_s']
+                      + res['tool_change_s'])
+    return res
+
+
+# ---------------------------------------------------------------------------
+# Instrumentation
+# ---------------------------------------------------------------------------
+
+class JobStats:
+    """Wall time, call count and items in/out per pipeline stage, plus
+    free-form counters. When disabled, stage() and count() do nothing, so
+    the calls can stay in the hot loops.
+
+    Items are points for geometry stages, paths for nesting/routing stages,
+    commands for emission and bytes for sending."""
+
+    def __init__(self, enabled=False):
+        self.enabled  = enabled
+        self.stages   = {}
+        self.counters = {}
+
+    @contextmanager
+    def stage(self, name, n_in=None):
+        """Times the with-block. The block may set rec['out']."""
+        if not self.enabled:
+            yield {}
+            return
+        rec = {}
+        t0 = time.perf_counter()
+        try:
+            yield rec
+        finally:
+            dt = time.perf_counter() - t0
+            st = self.stages.setdefault(
+                name, {'calls': 0, 'seconds': 0.0, 'in': 0, 'out': 0})
+            st['calls']   += 1
+            st['seconds'] += dt
+            if n_in is not None:
+                st['in'] += n_in
+            st['out'] += rec.get('out', 0)
+
+    def count(self, name, n=1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def report(self):
+        stages = {k: dict(v, seconds=round(v['seconds'], 6))
+                  for k, v in self.stages.items()}
+        return {'stages': stages, 'counters': dict(self.counters)}
+
+    def merge(self, report):
+        """Adds a report() taken elsewhere (e.g. in a worker process)."""
+        if not self.enabled:
+            return
+        for name, rec in report['stages'].items():
+            st = self.stages.setdefault(
+                name, {'calls': 0, 'seconds': 0.0, 'in': 0, 'out': 0})
+            for k in st:
+                st[k] += rec[k]
+        for name, n in report['counters'].items():
+            self.count(name, n)
+
+
+# ---------------------------------------------------------------------------
+# Worker processes
+# ---------------------------------------------------------------------------
+
+class WorkerPool:
+    """Ordered map() over worker processes for per-path geometry work.
+
+    workers: number of processes (0 = one per CPU, 1 = everything runs
+    here, serially). Small batches (< PARALLEL_MIN items) also run here,
+    where process start-up and pickling would cost more than they save.
+    Items go out in chunks (about four per worker) to amortize the IPC;
+    results come back in input order, so the output is the same for any
+    number of workers. The processes start on first use and stay up
+    until close()."""
+
+    def __init__(self, workers=1):
+        self.workers  = workers if workers > 0 else (os.cpu_count() or 1)
+        self.executor = None
+
+    def parallel(self, n_items):
+        """True if a batch of n_items would go to the workers."""
+        return self.workers > 1 and n_items >= PARALLEL_MIN
+
+    def map(self, fn, *iterables, work=None):
+        """Like map(fn, *iterables); the iterables must be lists.
+        fn has to be a module-level function (or a partial of one).
+        work: batch size for the PARALLEL_MIN test when the items are
+        not single paths (default: number of items)."""
+        n = len(iterables[0]) if iterables else 0
+        if not self.parallel(n if work is None else work):
+            return map(fn, *iterables)
+        if self.executor is None:
+            try:
+                self.executor = ProcessPoolExecutor(self.workers)
+            except (OSError, NotImplementedError) as e:
+                inkex.errormsg(f"Worker processes unavailable ({e}), running serially")
+                self.workers = 1
+                return map(fn, *iterables)
+        chunk = max(1, -(-n // (self.workers * 4)))
+        return self.executor.map(fn, *iterables, chunksize=chunk)
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+
+# ---------------------------------------------------------------------------
+# Per-path preparation
+# ---------------------------------------------------------------------------
+
+_NO_STATS = JobStats()
+
+
+def prepare_path(pts, is_closed, is_p1, knife_offset=0.0, overcut=0.0,
+                 rotate_seam=True, corner_sens=50, simplify=0.0,
+                 quantize=False, st=_NO_STATS):
+    """Closed -> open + knife offset + overcut; open -> knife offset;
+    then simplify. Lengths in mm; pts in mm, or plotter units when
+    quantize. Returns (open_pts, points before simplify).
+
+    Depends only on its arguments, so WorkerPool can run it for many
+    paths at once (st is then left out)."""
+    u = SCALE if quantize else 1.0
+    ears = []
+    if is_closed:
+        oc = overcut if is_p1 else 0.0
+        if is_p1 and rotate_seam:
+            with st.stage('rotate_seam', len(pts)) as rec:
+                pts = rotate_to_longest_straight(pts, 5.0*u)
+                rec['out'] = len(pts)
+        body = open_closed_path(pts, 0.0)
+        if is_p1 and knife_offset > 0:
+            with st.stage('corner_offset', len(body)) as rec:
+                if len(body) >= 4:
+                    base = body[:-1]
+                    cyclic = base + [base[0], base[1]]
+                    processed = apply_corner_offset(cyclic, knife_offset*u, corner_sens,
+                                                    1.5*u, ears)
+                    body = processed[:-1]
+                else:
+                    body = apply_corner_offset(body, knife_offset*u, corner_sens, 1.5*u,
+                                               ears)
+                rec['out'] = len(body)
+        if is_p1 and oc > 0:
+            with st.stage('overcut') as rec:
+                tail = follow_path(pts + [pts[0]], oc*u)
+                rec['out'] = len(tail)
+        else:
+            tail = []
+        open_pts = body + tail
+    else:
+        if is_p1 and knife_offset > 0:
+            with st.stage('corner_offset', len(pts)) as rec:
+                open_pts = apply_corner_offset(pts, knife_offset*u, corner_sens, 1.5*u,
+                                               ears)
+                rec['out'] = len(open_pts)
+        else:
+            open_pts = pts
+
+    n_raw = len(open_pts)
+    if simplify > 0:
+        # Ears are kept whole. Dashes are split afterwards, on the
+        # simplified line, so every dash boundary is still cut.
+        with st.stage('simplify', len(open_pts)) as rec:
+            open_pts = simplify_rdp(open_pts, simplify*u, ears)
+            rec['out'] = len(open_pts)
+    # Off-grid points only come from ears, the seam point and the overcut
+    if quantize and (ears or is_closed):
+        open_pts = quantize_pts(open_pts, 1)
+    return open_pts, n_raw
+
+
+# ---------------------------------------------------------------------------
+# Multi-plotter dispatch
+# ---------------------------------------------------------------------------
+
+def parse_endpoints(spec, default_port):
+    """Parses "ip[:port], ip[:port], ..." into a list of (host, port).
+    Entries without a port use default_port; empty entries are skipped."""
+    endpoints = []
+    for entry in re.split(r'[,;\s]+', spec or ""):
+        if not entry:
+            continue
+        host, sep, port = entry.rpartition(':')
+        if not sep:
+            host, port = entry, default_port
+        try:
+            endpoints.append((host, int(port)))
+        except ValueError:
+            inkex.errormsg(f"Ignoring invalid plotter address: {entry}")
+    return endpoints
+
+
+class PlotterPool:
+    """Pool of plotter endpoints fed from one job queue.
+
+    Every endpoint has its own worker, so jobs go to whichever machine
+    frees up first and several plotters are fed at the same time.
+
+    A plotter does not report when it has finished cutting (it buffers the
+    job and keeps cutting after the send), and only the operator knows when
+    the next sheet is loaded. So by default every plotter takes one job per
+    run; the jobs left over stay in self.pending for the next run. With
+    reuse=True, a plotter takes its next job once that job's busy time,
+    counted from the start of the send, has passed; the run then blocks
+    for as long as the plotters are busy.
+
+    A plotter that fails (refused connection, timeout) is taken out of the
+    pool and its job is put back in the queue for the remaining machines.
+    Jobs that no machine could take end up in self.failed.
+
+    clock and sleep are the time source (tests pass fake ones); self.log
+    lists (endpoint, job name, send start) in send order.
+    """
+
+    CHUNK = 4096
+
+    def __init__(self, endpoints, timeout=180, reuse=False,
+                 clock=time.perf_counter, sleep=asyncio.sleep):
+        self.endpoints = list(dict.fromkeys(endpoints))
+        self.timeout   = timeout
+        self.reuse     = reuse
+        self.clock     = clock
+        self.sleep     = sleep
+        self.stats     = {ep: {'jobs': 0, 'bytes': 0, 'seconds': 0.0,
+                               'busy_s': 0.0, 'errors': 0}
+                          for ep in self.endpoints}
+        self.failed    = []
+        self.pending   = []
+        self.log       = []
+        self._alive    = 0
+
+    def run(self, jobs):
+        """jobs: list of (name, data_bytes, busy_s), busy_s being how long
+        the plotter stays busy with the job (used with reuse). Blocks until
+        every job has been sent, or has no plotter left to go to."""
+        asyncio.run(self._run(jobs))
+        return self.stats
+
+    async def _run(self, jobs):
+        queue = asyncio.Queue()
+        for job in jobs:
+            queue.put_nowait(job)
+        self._alive = len(self.endpoints)
+        workers = [asyncio.create_task(self._worker(ep, queue))
+                   for ep in self.endpoints]
+        await queue.join()
+        for w in workers:
+            w.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+    def _retire(self, queue, into):
+        """A worker leaves the pool; the last one moves the queued jobs
+        into `into` (failed or pending)."""
+        self._alive -= 1
+        if self._alive <= 0:
+            while not queue.empty():
+                into.append(queue.get_nowait()[0])
+                queue.task_done()
+
+    async def _stream(self, host, port, data):
+        _, writer = await asyncio.wait_for(
+            asyncio.open_connection(host, port), self.timeout)
+        try:
+            for off in range(0, len(data), self.CHUNK):
+                writer.write(data[off:off+self.CHUNK])
+                await asyncio.wait_for(writer.drain(), self.timeout)
+            if writer.can_write_eof():
+                writer.write_eof()
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+
+    async def _worker(self, ep, queue):
+        st = self.stats[ep]
+        while True:
+            job = await queue.get()
+            name, data, busy = job
+            t0 = self.clock()
+            try:
+                await self._stream(ep[0], ep[1], data)
+            except (OSError, asyncio.TimeoutError) as e:
+                st['errors'] += 1
+                inkex.errormsg(f"Send error ({ep[0]}:{ep[1]}, {name}): {e}")
+                if self._alive > 1:
+                    queue.put_nowait(job)
+                else:
+                    self.failed.append(name)
+                self._retire(queue, self.failed)
+                queue.task_done()
+                return
+            sent = self.clock() - t0
+            st['jobs']    += 1
+            st['bytes']   += len(data)
+            st['seconds'] += sent
+            st['busy_s']  += max(busy, sent) if self.reuse else sent
+            self.log.append((ep, name, t0))
+            inkex.errormsg(f"Sent {name} to {ep[0]}:{ep[1]} ({len(data)} bytes)")
+            if not self.reuse:
+                # Next sheet not loaded yet: this plotter is done for the run
+                self._retire(queue, self.pending)
+                queue.task_done()
+                return
+            queue.task_done()
+            # The plotter is still cutting from its buffer: wait for the job
+            # to finish before this endpoint takes the next one.
+            if busy > sent:
+                await self.sleep(busy - sent)
+
+
 # ---------------------------------------------------------------------------
 # Main extension
 # ---------------------------------------------------------------------------
@@ -768,8 +2622,15 @@ class SkyCutV5Eng(inkex.EffectExtension):
         pars.add_argument("--paper_size",    type=str,           default="a4p")
         pars.add_argument("--auto_nesting",  type=inkex.Boolean, default=True)
         pars.add_argument("--nesting_order", type=str,           default="inside_first")
+        pars.add_argument("--route_cluster", type=int,           default=0)
+        pars.add_argument("--route_seed",    type=str,           default="auto")
+        pars.add_argument("--route_budget",  type=float,         default=0.0)
         pars.add_argument("--ip",            type=str,           default="192.168.0.233")
         pars.add_argument("--port",          type=int,           default=8080)
+        pars.add_argument("--plotters",      type=str,           default="")
+        pars.add_argument("--copies",        type=int,           default=1)
+        pars.add_argument("--copy_wait",     type=str,           default="manual")
+        pars.add_argument("--copy_gap",      type=float,         default=10.0)
         pars.add_argument("--knife_offset_mm", type=float,       default=0.25)
         pars.add_argument("--overcut_mm",    type=float,         default=1.00)
         pars.add_argument("--corner_sensitivity", type=int,      default=50)
@@ -791,6 +2652,7 @@ class SkyCutV5Eng(inkex.EffectExtension):
         pars.add_argument("--red_force", type=int, default=52)
         pars.add_argument("--red_speed", type=int, default=7)
         pars.add_argument("--red_seq",   type=int, default=4)
+        pars.add_argument("--sequence",  type=str, default="route")
         # Dashed - dropdown per color: "yes"/"no"
         pars.add_argument("--black_dashed",  type=str, default="no")
         pars.add_argument("--green_dashed",  type=str, default="no")
@@ -805,16 +2667,54 @@ class SkyCutV5Eng(inkex.EffectExtension):
         pars.add_argument("--gap_force",   type=int,           default=5)
         pars.add_argument("--cut_quickly", type=inkex.Boolean, default=False)
         pars.add_argument("--travel_speed", type=int,          default=350)
+        pars.add_argument("--optimize_hpgl", type=inkex.Boolean, default=False)
+        pars.add_argument("--quantize",      type=inkex.Boolean, default=False)
+        pars.add_argument("--simplify_mm",   type=float,         default=0.0)
+        pars.add_argument("--workers",       type=int,           default=1)
+        pars.add_argument("--cut_scope",     type=str,           default="all")
+        pars.add_argument("--region_x",      type=float,         default=0.0)
+        pars.add_argument("--region_y",      type=float,         default=0.0)
+        pars.add_argument("--region_w",      type=float,         default=100.0)
+        pars.add_argument("--region_h",      type=float,         default=100.0)
         pars.add_argument("--save_hpgl",     type=inkex.Boolean, default=False)
         pars.add_argument("--output_path",   type=str,           default="skycut_v5_eng_output.hpgl")
         pars.add_argument("--debug",         type=inkex.Boolean, default=False)
+        pars.add_argument("--stats_report",  type=inkex.Boolean, default=False)
+        # Profiling: none / cprofile / tracemalloc / both
+        pars.add_argument("--profile",       type=str,           default="none")
+        pars.add_argument("--profile_dir",   type=str,           default="")
+        pars.add_argument("--profile_top",   type=int,           default=25)
+        # Cut-time estimate (shown in debug mode)
+        pars.add_argument("--est_cut_speed",    type=float, default=350.0)
+        pars.add_argument("--est_travel_speed", type=float, default=350.0)
+        pars.add_argument("--est_accel",        type=float, default=2000.0)
+        pars.add_argument("--est_corner_deg",   type=float, default=30.0)
+        pars.add_argument("--est_tool_change",  type=float, default=1.5)
+
+    def __init__(self):
+        super().__init__()
+        self.stats    = JobStats(False)
+        self.estimate = None
+        self.job      = None
 
     def effect(self):
+        if self.options.profile != "none":
+            self._run_profiled(self._effect)
+        else:
+            self._effect()
+
+    def _effect(self):
+        self.stats = JobStats(self.options.stats_report)
+        with self.stats.stage('total'):
+            self._run_job()
+        if self.options.stats_report:
+            self._write_stats_report()
+
+    def _run_job(self):
         output = self._build_hpgl()
         if output is None:
             return
         if self.options.save_hpgl:
-            import os
             out_path = self.options.output_path.strip()
             if not out_path:
                 inkex.errormsg("Output file not set"); return
@@ -822,12 +2722,12 @@ class SkyCutV5Eng(inkex.EffectExtension):
             if not os.path.isdir(out_dir):
                 inkex.errormsg(f"Directory does not exist: {out_dir}"); return
             try:
-                with open(out_path, "w", encoding="utf-8") as f:
+                with open(out_path, "wb") as f:
                     f.write(output)
                 inkex.errormsg(f"HPGL saved: {out_path}")
             except OSError as e:
                 inkex.errormsg(f"Write error: {e}"); return
-            html = self._build_viewer_html(output)
+            html = self._build_viewer_html(output.decode('ascii'))
             tmp  = tempfile.NamedTemporaryFile(
                 suffix=".html", delete=False, mode="w", encoding="utf-8")
             tmp.write(html); tmp.close()
@@ -835,9 +2735,113 @@ class SkyCutV5Eng(inkex.EffectExtension):
         else:
             self._send_to_cutter(output)
 
+    def _run_profiled(self, func):
+        """Runs func under cProfile and/or tracemalloc and saves
+        skycut_<time>.prof (+ a text summary) and skycut_<time>_alloc.txt
+        with the top-N allocation sites to profile_dir."""
+        import cProfile
+        import io
+        import pstats
+        import tracemalloc
+        mode  = self.options.profile
+        top_n = max(1, self.options.profile_top)
+        out_dir = self.options.profile_dir.strip() or tempfile.gettempdir()
+        if not os.path.isdir(out_dir):
+            inkex.errormsg(f"Directory does not exist: {out_dir}")
+            func(); return
+        base = os.path.join(out_dir, "skycut_" + time.strftime("%Y%m%d-%H%M%S"))
+
+        prof = cProfile.Profile() if mode in ("cprofile", "both") else None
+        trace = mode in ("tracemalloc", "both")
+        started = False         # leave tracing started by someone else running
+        if trace:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(10)
+                started = True
+            baseline = tracemalloc.take_snapshot()
+        try:
+            if prof:
+                prof.enable()
+            func()
+        finally:
+            if prof:
+                prof.disable()
+            if trace:
+                snapshot = tracemalloc.take_snapshot()
+                current, peak = tracemalloc.get_traced_memory()
+                if started:
+                    tracemalloc.stop()
+                filters = (
+                    tracemalloc.Filter(False, tracemalloc.__file__),
+                    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+                    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+                )
+                snapshot = snapshot.filter_traces(filters)
+                baseline = baseline.filter_traces(filters)
+                lines = [f"Peak traced memory: {peak / 1048576:.1f} MiB, "
+                         f"still allocated: {current / 1048576:.1f} MiB",
+                         f"Top {top_n} allocation sites by growth over the run "
+                         f"(after vs. before), with tracebacks:", ""]
+                diffs = snapshot.compare_to(baseline, "traceback")[:top_n]
+                for k, stat in enumerate(diffs, 1):
+                    lines.append(f"{k:3}. {stat.size_diff / 1024:+.1f} KiB "
+                                 f"({stat.count_diff:+} blocks), "
+                                 f"{stat.size / 1024:.1f} KiB held")
+                    lines.extend("     " + line
+                                 for line in stat.traceback.format(most_recent_first=True))
+                self._write_profile_file(base + "_alloc.txt", "\n".join(lines) + "\n")
+            if prof:
+                try:
+                    prof.dump_stats(base + ".prof")
+                    inkex.errormsg(f"Profile saved: {base}.prof")
+                except OSError as e:
+                    inkex.errormsg(f"Write error: {e}")
+                buf = io.StringIO()
+                pstats.Stats(prof, stream=buf).sort_stats("cumulative").print_stats(top_n)
+                self._write_profile_file(base + "_profile.txt", buf.getvalue())
+
+    @staticmethod
+    def _write_profile_file(path, text):
+        try:
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(text)
+            inkex.errormsg(f"Profile saved: {path}")
+        except OSError as e:
+            inkex.errormsg(f"Write error: {e}")
+
+    def _write_stats_report(self):
+        """JSON report: next to the HPGL when saving, otherwise to stderr."""
+        report = self.stats.report()
+        if self.estimate is not None:
+            report['estimate'] = self.estimate
+        text = json.dumps(report, indent=2, sort_keys=True)
+        out_path = self.options.output_path.strip()
+        if self.options.save_hpgl and out_path:
+            rep_path = os.path.splitext(out_path)[0] + ".stats.json"
+            try:
+                with open(rep_path, "w", encoding="utf-8") as f:
+                    f.write(text)
+                inkex.errormsg(f"Stats saved: {rep_path}")
+                return
+            except OSError as e:
+                inkex.errormsg(f"Write error: {e}")
+        inkex.errormsg(text)
+
     # ------------------------------------------------------------------
 
     def _build_hpgl(self):
+        """Builds the job into self.job and returns the serialized bytes
+        (None when there is nothing to cut)."""
+        pool = WorkerPool(self.options.workers)
+        try:
+            return self._build_job(pool)
+        finally:
+            pool.close()
+
+    def _build_job(self, pool):
+        self.estimate = None
+        self.job      = None
+        st            = self.stats
         svg           = self.svg
         k_off         = self.options.knife_offset_mm
         ov_mm         = self.options.overcut_mm
@@ -846,6 +2850,11 @@ class SkyCutV5Eng(inkex.EffectExtension):
         use_markers   = self.options.use_markers
         auto_nesting  = self.options.auto_nesting
         nesting_order = self.options.nesting_order
+        quantize      = self.options.quantize
+        simplify_mm   = self.options.simplify_mm
+        # Geometry unit: mm, or integer plotter units (SCALE per mm) when
+        # quantized. Every length threshold below is multiplied by u.
+        u             = SCALE if quantize else 1.0
 
         paper_sizes = {
             'a4p': (210.0, 297.0), 'a4l': (297.0, 210.0),
@@ -886,35 +2895,31 @@ class SkyCutV5Eng(inkex.EffectExtension):
         else:
             color_settings = None   # simple mode: black=P0, others=P1
 
-        all_paths = process_elements(cut_layer, color_settings, scale, scale)
-        if not all_paths:
-            inkex.errormsg("No paths found in Cut layer"); return None
-
-        all_paths.sort(key=lambda x: x['priority'])
-        priority_groups = [list(g) for _, g in groupby(all_paths, key=lambda x: x['priority'])]
-
-        final_sequence = []
-        for group in priority_groups:
-            if auto_nesting and any(p['is_closed'] for p in group):
-                depths, centroids = compute_depths(group)
-                islands           = group_into_islands(group, depths, centroids)
-                ordered_islands   = []
-                for island_idx_list in islands:
-                    ordered_idx = sort_island_paths(island_idx_list, group, depths, nesting_order)
-                    ordered_islands.append(ordered_idx)
-                # Route islands by nearest-neighbor + 2-opt
-                island_starts = [(group[isl[0]]['pts'][0], isl) for isl in ordered_islands]
-                island_starts = nearest_neighbor_sort(island_starts, lambda x: x[0])
-                if len(island_starts) > 3:
-                    island_starts = two_opt(island_starts, lambda x: x[0])
-                for _, isl in island_starts:
-                    for idx in isl:
-                        final_sequence.append(group[idx])
-            else:
-                items = nearest_neighbor_sort(list(group), lambda p: p['pts'][0])
-                if len(items) > 3:
-                    items = two_opt(items, lambda p: p['pts'][0])
-                final_sequence.extend(items)
+        # Test cuts: only the selection, or only what touches a rectangle
+        # (mm, page coordinates). Without markers the job frame is then
+        # taken from what is cut, as for a document holding just that.
+        selected = region = None
+        where = "Cut layer"
+        if o.cut_scope == 'selection':
+            selected = {elem.get_id() for elem in svg.selection.values()}
+            if not selected:
+                inkex.errormsg("Cut scope is 'selection' but nothing is selected")
+                return None
+            where = "the selection"
+        elif o.cut_scope == 'region':
+            if o.region_w <= 0 or o.region_h <= 0:
+                inkex.errormsg("Region width and height must be > 0"); return None
+            region = (o.region_x, o.region_y,
+                      o.region_x + o.region_w, o.region_y + o.region_h)
+            where = "the region"
+
+        with st.stage('process_elements') as rec:
+            store = process_elements(cut_layer, color_settings, scale, scale,
+                                     quantize, selected, region, pool)
+            rec['out'] = store.total_points()
+        if not len(store):
+            inkex.errormsg(f"No paths found in {where}"); return None
+        st.count('paths', len(store))
 
         # Coordinate transform
         if use_markers:
@@ -942,12 +2947,14 @@ class SkyCutV5Eng(inkex.EffectExtension):
             max_y = max(p[1] for p in marker_points)
             work_w = max_x - min_x; work_h = max_y - min_y
 
-            def coord(px, py):
-                return (int(round((work_h-(py-min_y))*SCALE)),
-                        int(round((work_w-(px-min_x))*SCALE)))
+            if quantize:
+                coord = PlotterFrame(round(work_w*SCALE), round(work_h*SCALE),
+                                     round(min_x*SCALE), round(min_y*SCALE), 1)
+            else:
+                coord = PlotterFrame(work_w, work_h, min_x, min_y)
 
             cmd103 = "CMD:103,0;" if o.use_colors else ""
-            hpgl = [
+            header = [
                 "IN;", "PA;",
                 f"FSIZE{int(page_h*SCALE)},{int(page_w*SCALE)};",
                 f"CMD:32,{int(page_h*SCALE)},{int(page_w*SCALE)},"
@@ -956,86 +2963,193 @@ class SkyCutV5Eng(inkex.EffectExtension):
                 f"TB26,{int(work_h*SCALE)},{int(work_w*SCALE)};",
             ]
         else:
-            all_x = [p[0] for item in final_sequence for p in item['pts']]
-            all_y = [p[1] for item in final_sequence for p in item['pts']]
-            max_x_bb = max(all_x); max_y_bb = max(all_y)
+            max_x_bb, max_y_bb = store.bounds_max()
 
-            def coord(px, py):
-                return (int(round((max_y_bb-py)*SCALE)),
-                        int(round((max_x_bb-px)*SCALE)))
+            coord = PlotterFrame(max_x_bb, max_y_bb, scale=1 if quantize else SCALE)
 
             cmd103 = "CMD:103,0;" if o.use_colors else ""
-            hpgl = ["IN;", "PA;", "CMD:18,1;", cmd103, "CMD:35,1,2,0;"]
+            header = ["IN;", "PA;", "CMD:18,1;", cmd103, "CMD:35,1,2,0;"]
+
+        # Prepare the points once per geometry (source path, knife or not):
+        # one batch through the workers, or here. Instances reuse the
+        # prepared points of their source, shifted.
+        needed    = {}
+        for i in range(len(store)):
+            needed.setdefault((store.src[i], store.tool[i] == "P1"), None)
+        needed    = list(needed)
+        parallel  = pool.parallel(len(needed))
+        prepare   = partial(prepare_path, knife_offset=k_off, overcut=ov_mm,
+                            rotate_seam=o.rotate_seam, corner_sens=corner_sens,
+                            simplify=simplify_mm, quantize=quantize,
+                            st=_NO_STATS if parallel else st)
+        closed    = [store.is_closed(s) for s, _ in needed]
+        knife     = [p1 for _, p1 in needed]
+        if parallel:
+            prepped = pool.map(prepare, [store.pts(s) for s, _ in needed],
+                               closed, knife)
+            st.count('prepared_in_workers', len(needed))
+        else:
+            prepped = map(prepare, (store.pts(s) for s, _ in needed), closed, knife)
+        # (source path, is_p1) -> prepare_path() result
+        prepared  = dict(zip(needed, prepped))
+
+        def cut_ends(i):
+            """(start, exit) of path i as it will be cut."""
+            pts = prepared[(store.src[i], store.tool[i] == "P1")][0]
+            dx = store.dx[i]; dy = store.dy[i]
+            return ((pts[0][0] + dx, pts[0][1] + dy),
+                    (pts[-1][0] + dx, pts[-1][1] + dy))
+
+        # Routing works on path indices into the store
+        prio = store.priority
+        by_prio = sorted(range(len(store)), key=prio.__getitem__)
+        priority_groups = [list(g) for _, g in groupby(by_prio, key=prio.__getitem__)]
+        if o.sequence == 'settings':
+            # Colors sharing a sequence number are no longer interleaved:
+            # one run per tool/force/speed, routed on its own
+            priority_groups = split_by_settings(
+                priority_groups,
+                lambda i: (store.tool[i], store.force[i] or 0, store.speed[i] or 0))
+
+        # The groups are routed independently (in workers for big jobs),
+        # then each tour is re-rooted at the unit nearest to where the
+        # previous group ends, and run whichever way round is shorter
+        # (join_groups).
+        # A group big enough to be routed in clusters keeps the workers
+        # busy by itself: then the groups go one by one and their
+        # clusters to the workers.
+        route  = partial(route_group, store, auto_nesting=auto_nesting,
+                         nesting_order=nesting_order, timed=st.enabled,
+                         cluster_size=o.route_cluster, seed=o.route_seed,
+                         budget=o.route_budget)
+        if o.route_cluster and max(map(len, priority_groups)) > o.route_cluster:
+            routes = [route(group, pool=pool) for group in priority_groups]
+        else:
+            routes = list(pool.map(route, priority_groups, work=len(store)))
+            if pool.parallel(len(store)) and len(priority_groups) > 1:
+                st.count('groups_routed_in_workers', len(priority_groups))
+        tours, joins = join_groups([units for units, _ in routes], cut_ends,
+                                   coord.home())
+        if o.route_budget > 0:
+            before = sum(r['counters'].get('route_length_2opt', 0.0) for _, r in routes) / u
+            after  = sum(r['counters'].get('route_length_final', 0.0) for _, r in routes) / u
+            inkex.errormsg(f"Route optimizer ({o.route_budget:g} s): {before:.0f} -> {after:.0f} mm "
+                           f"between path starts, {(before - after) * 100.0 / max(before, 1e-9):.1f}% "
+                           f"shorter than nearest neighbor + 2-opt")
+        final_sequence = []
+        for group, (_, report), units, (rev, shift) in zip(priority_groups, routes,
+                                                         tours, joins):
+            st.merge(report)
+            st.count(f"paths_priority_{prio[group[0]]}", len(group))
+            if rev:
+                st.count('groups_reversed')
+            if shift:
+                st.count('groups_rerooted')
+            for unit in units:
+                final_sequence.extend(unit)
+
+        job = HpglJob()
+        for cmd in header:
+            job.verbatim(cmd)
 
         # Emit paths.
         # Color mode: before each block with new settings -> P;FS;VS
         # Simple mode: only P on tool change (like v3)
         current_key = None
-        for item in final_sequence:
+        simplify_in = simplify_out = 0
+        changes = {'tool': 0, 'force': 0, 'speed': 0}
+        for i in final_sequence:
+            tool  = store.tool[i]
+            force = store.force[i]
             if o.use_colors:
-                key = (item['tool'], item['force'], item['speed'])
+                key = (tool, force, store.speed[i])
                 if key != current_key:
-                    hpgl.append(f"{item['tool']};")
-                    hpgl.append(f"FS{item['force']};")
-                    hpgl.append(f"VS{item['speed']};")
+                    if current_key is not None:
+                        for name, old, new in zip(('tool', 'force', 'speed'), current_key, key):
+                            changes[name] += old != new
+                    job.tool(tool)
+                    job.force(force)
+                    job.speed(store.speed[i])
                     current_key = key
             else:
-                if item['tool'] != current_key:
-                    hpgl.append(f"{item['tool']};")
-                    current_key = item['tool']
+                if tool != current_key:
+                    if current_key is not None:
+                        changes['tool'] += 1
+                    job.tool(tool)
+                    current_key = tool
 
-            pts       = item['pts']
-            is_closed = item['is_closed']
-            is_p1     = item['tool'] == "P1"
-            is_dashed = item.get('dashed', False)
+            is_closed = store.is_closed(i)
+            is_p1     = tool == "P1"
+            is_dashed = store.dashed(i)
 
             if debug:
-                inkex.errormsg(f"DEBUG path: pts={len(pts)} closed={is_closed} "
-                               f"curve={item['has_curve']} tool={item['tool']} "
+                inkex.errormsg(f"DEBUG path: pts={store.n_points(i)} closed={is_closed} "
+                               f"curve={store.has_curve(i)} tool={tool} "
                                f"dashed={is_dashed}")
 
-            # Prepare the points (closed -> open + knife offset + overcut;
-            # open -> knife offset). Then, if dashed, cut dashed.
-            if is_closed:
-                oc = ov_mm if is_p1 else 0.0
-                if is_p1 and self.options.rotate_seam:
-                    pts = rotate_to_longest_straight(pts)
-                body = open_closed_path(pts, 0.0)
-                if is_p1 and k_off > 0:
-                    if len(body) >= 4:
-                        base = body[:-1]
-                        cyclic = base + [base[0], base[1]]
-                        processed = apply_corner_offset(cyclic, k_off, corner_sens)
-                        body = processed[:-1]
-                    else:
-                        body = apply_corner_offset(body, k_off, corner_sens)
-                if is_p1 and oc > 0:
-                    tail = follow_path(pts + [pts[0]], oc)
-                else:
-                    tail = []
-                open_pts = body + tail
-            else:
-                if is_p1 and k_off > 0:
-                    open_pts = apply_corner_offset(pts, k_off, corner_sens)
-                else:
-                    open_pts = list(pts)
+            # Prepared points; then, if dashed, cut dashed.
+            open_pts, n_raw = prepared[(store.src[i], is_p1)]
+            if simplify_mm > 0:
+                simplify_in  += n_raw
+                simplify_out += len(open_pts)
+            dx = store.dx[i]; dy = store.dy[i]
+            if dx or dy:
+                open_pts = [(x + dx, y + dy) for x, y in open_pts]
 
+            n_cmds = len(job)
             if is_dashed:
                 # Dashed: US travel speed + dash/gap splitting
-                hpgl.append(f"US{o.travel_speed};")
-                df = o.dash_force if o.use_dash_force else None
-                gf = o.gap_force  if o.use_gap_force  else None
-                emit_dashed_path(hpgl, open_pts, coord,
-                                 o.dash_len, o.gap_len, df, gf,
-                                 o.cut_quickly, item['force'] if item['force'] else 52)
+                with st.stage('emit_dashed', len(open_pts)) as rec:
+                    job.travel_speed(o.travel_speed)
+                    df = o.dash_force if o.use_dash_force else None
+                    gf = o.gap_force  if o.use_gap_force  else None
+                    emit_dashed_path(job, open_pts, coord,
+                                     o.dash_len, o.gap_len, df, gf,
+                                     o.cut_quickly, force if force else 52, u)
+                    rec['out'] = len(job) - n_cmds
             else:
-                emit_open_path(hpgl, open_pts, coord)
-
-        hpgl.extend(["U0,0;", "@;", "@;"])
-        output = "".join(hpgl)
+                with st.stage('emit', len(open_pts)) as rec:
+                    emit_open_path(job, open_pts, coord, u)
+                    rec['out'] = len(job) - n_cmds
+
+        job.up(0, 0)
+        job.verbatim("@;"); job.verbatim("@;")
+        for name, n in changes.items():
+            st.count(f"{name}_changes", n)
+        if o.sequence == 'settings':
+            inkex.errormsg(f"Settings changes: {changes['tool']} tool (P0/P1), "
+                           f"{changes['force']} force, {changes['speed']} speed")
+        if simplify_mm > 0:
+            st.count('simplify_points_removed', simplify_in - simplify_out)
+            inkex.errormsg(f"Simplify ({simplify_mm} mm): {simplify_in} -> {simplify_out} "
+                           f"points ({(simplify_in - simplify_out) * 100.0 / max(simplify_in, 1):.1f}% "
+                           f"fewer), {len(job)} HPGL commands")
+        if o.optimize_hpgl:
+            with st.stage('peephole', len(job)) as rec:
+                job, saved = peephole_optimize(job)
+                rec['out'] = len(job)
+            st.count('peephole_commands_saved', saved['commands_saved'])
+            st.count('peephole_bytes_saved', saved['bytes_saved'])
+            inkex.errormsg(f"HPGL optimizer: {saved['commands_saved']} commands, "
+                           f"{saved['bytes_saved']} bytes saved")
+        self.job = job
+        with st.stage('serialize', len(job)):
+            output = job.serialize()
+        st.count('hpgl_commands', len(job))
+        st.count('hpgl_bytes', len(output))
 
         if debug:
-            inkex.errormsg(f"DEBUG total HPGL commands: {len(hpgl)}")
+            inkex.errormsg(f"DEBUG total HPGL commands: {len(job)}")
+            est = estimate_cut_time(
+                job, o.est_cut_speed, o.est_travel_speed, o.est_accel,
+                o.est_corner_deg, tool_change_time=o.est_tool_change)
+            self.estimate = est
+            inkex.errormsg(f"DEBUG estimate: {est['total_s']/60:.2f} min "
+                           f"(cut {est['cut_s']:.1f} s / {est['cut_mm']:.0f} mm, "
+                           f"travel {est['travel_s']:.1f} s / {est['travel_mm']:.0f} mm, "
+                           f"pen {est['pen_s']:.1f} s / {est['pen_lifts']} lifts, "
+                           f"tool changes {est['tool_change_s']:.1f} s / "
+                           f"{est['tool_changes']})")
 
         return output
 
@@ -1263,20 +3377,62 @@ process();
 </script></body></html>"""
 
     def _send_to_cutter(self, output):
+        o = self.options
+        extra = parse_endpoints(o.plotters, o.port)
+        if extra or o.copies > 1:
+            with self.stats.stage('dispatch', len(output)):
+                self._dispatch_to_pool(output, [(o.ip, o.port)] + extra)
+            return
         CHUNK = 4096
-        data  = output.encode()
+        st    = self.stats
+        data  = output
         try:
-            with socket.create_connection(
-                    (self.options.ip, self.options.port), timeout=180) as s:
+            with st.stage('connect'):
+                conn = socket.create_connection(
+                    (self.options.ip, self.options.port), timeout=180)
+            with conn as s, st.stage('send', len(data)) as rec:
                 sent = 0
                 while sent < len(data):
                     s.sendall(data[sent:sent+CHUNK])
                     sent += CHUNK
                 s.shutdown(socket.SHUT_WR)
+                rec['out'] = len(data)
             inkex.errormsg(f"Sent OK ({len(data)} bytes)")
         except OSError as e:
             inkex.errormsg(f"Send error ({self.options.ip}:{self.options.port}): {e}")
 
+    def _dispatch_to_pool(self, output, endpoints):
+        """Sends `copies` copies of the job across all plotters in parallel
+        and reports per-machine throughput. Each plotter takes one copy per
+        run, unless copy_wait is "timed": then a plotter gets its next copy
+        once the predicted cut time (estimate_cut_time) plus copy_gap
+        seconds for the sheet change has passed."""
+        o = self.options
+        data = output
+        timed = o.copy_wait == "timed"
+        busy = 0.0
+        if timed:
+            est = estimate_cut_time(
+                self.job if self.job is not None else data.decode('ascii', 'replace'),
+                o.est_cut_speed, o.est_travel_speed, o.est_accel, o.est_corner_deg,
+                tool_change_time=o.est_tool_change)
+            busy = est['total_s'] + max(0.0, o.copy_gap)
+            inkex.errormsg(f"Each copy keeps a plotter busy ~{busy:.0f} s "
+                           f"({est['total_s']:.0f} s cut + {max(0.0, o.copy_gap):.0f} s "
+                           f"sheet change)")
+        jobs = [(f"copy {k+1}", data, busy) for k in range(max(1, o.copies))]
+        pool = PlotterPool(endpoints, reuse=timed)
+        pool.run(jobs)
+        for (host, port), st in pool.stats.items():
+            rate = st['bytes'] / st['seconds'] / 1024 if st['seconds'] > 0 else 0.0
+            inkex.errormsg(f"{host}:{port}: {st['jobs']} job(s), {st['bytes']} bytes "
+                           f"in {st['seconds']:.1f} s ({rate:.1f} KB/s), "
+                           f"busy {st['busy_s']:.0f} s, {st['errors']} error(s)")
+        if pool.pending:
+            inkex.errormsg(f"Not sent yet: {', '.join(pool.pending)}. Change the sheets "
+                           f"and run again with Copies = {len(pool.pending)}.")
+        if pool.failed:
+            inkex.errormsg(f"Not sent (no plotter available): {', '.join(pool.failed)}")
 
 if __name__ == "__main__":
     SkyCutV5Eng().run()
@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""
+golden_v5.py — golden-output regression check for the v5 engine (skycut_v5_eng).
+
+What it does:
+  * Runs every case in CASES (an SVG from ./corpus plus plugin options)
+    through the HPGL build of the extension. Nothing is sent, no viewer.
+  * Compares the result with ./golden/<case>.hpgl in two ways:
+      - exact:     byte-for-byte identical output
+      - geometric: symmetric Hausdorff distance (mm) between the cut
+                   polylines (all pen-down moves) of both jobs, so a change
+                   in routing order or point spacing that still cuts the
+                   same shapes passes.
+  * Prints quality metrics per case next to the golden ones: commands,
+    bytes, cut length, pen-up length and predicted time (estimate_cut_time).
+  * Route budgets (--route_budget) run on a step clock instead of wall
+    time, so their output is exact too.
+  * Checks that every quantized case in QUANTIZED_PAIRS produces no more
+    commands or bytes than the same job in float mode.
+  * --record appends the metrics, tagged with the current git commit, to
+    metrics.jsonl, so they can be followed commit by commit. Run it on
+    every commit that changes the engine and commit the log with the next
+    change; a run on uncommitted engine changes is tagged <commit>-dirty.
+
+Usage:
+  python3 golden_v5.py                 # check, exit 1 on geometric mismatch
+  python3 golden_v5.py --exact         # also fail on any byte difference
+  python3 golden_v5.py --update        # rewrite the golden files
+  python3 golden_v5.py --record        # check + append metrics.jsonl
+  python3 golden_v5.py -k mixed        # only cases whose name contains "mixed"
+
+Only --update changes the golden files; do it when an output change is
+intended, and commit the new goldens together with that change.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "extensions"))
+
+import skycut_v5_eng  # noqa: E402
+from skycut_v5_eng import SkyCutV5Eng, SCALE, estimate_cut_time  # noqa: E402
+
+CORPUS_DIR  = os.path.join(HERE, "corpus")
+GOLDEN_DIR  = os.path.join(HERE, "golden")
+METRICS_LOG = os.path.join(HERE, "metrics.jsonl")
+
+# case name -> (corpus file, plugin options)
+CASES = {
+    "mixed_simple":         ("mixed.svg", []),
+    "mixed_colors":         ("mixed.svg", ["--use_colors=true"]),
+    "mixed_dashed_quick":   ("mixed.svg", ["--use_colors=true", "--green_dashed=yes",
+                                           "--cut_quickly=true"]),
+    "mixed_markers_dashed": ("mixed.svg", ["--use_colors=true", "--yellow_dashed=yes",
+                                           "--use_markers=true"]),
+    "mixed_no_nesting":     ("mixed.svg", ["--auto_nesting=false",
+                                           "--rotate_seam=false"]),
+    "mixed_outside_first":  ("mixed.svg", ["--nesting_order=outside_first",
+                                           "--knife_offset_mm=0.5",
+                                           "--overcut_mm=2.0"]),
+    "labels":               ("labels.svg", ["--paper_size=a3l"]),
+    "islands":              ("islands.svg", ["--paper_size=a3l"]),
+    "text":                 ("text.svg", ["--paper_size=a3l",
+                                          "--corner_sensitivity=90"]),
+    "perforation":          ("perforation.svg", ["--paper_size=a3l", "--use_colors=true",
+                                                 "--green_dashed=yes"]),
+    "box":                  ("box.svg", ["--paper_size=a3l"]),
+    "mixed_optimized":      ("mixed.svg", ["--use_colors=true", "--yellow_dashed=yes",
+                                           "--use_markers=true", "--optimize_hpgl=true"]),
+    "perforation_optimized": ("perforation.svg", ["--paper_size=a3l", "--use_colors=true",
+                                                  "--green_dashed=yes", "--cut_quickly=true",
+                                                  "--optimize_hpgl=true"]),
+    "mixed_quantized":      ("mixed.svg", ["--use_colors=true", "--yellow_dashed=yes",
+                                           "--knife_offset_mm=0.5", "--quantize=true"]),
+    "perforation_simplified": ("perforation.svg", ["--paper_size=a3l", "--use_colors=true",
+                                                   "--green_dashed=yes", "--simplify_mm=0.05"]),
+    "islands_simplified":   ("islands.svg", ["--paper_size=a3l", "--simplify_mm=0.05"]),
+    "shapes":               ("shapes.svg", ["--paper_size=a3l", "--use_colors=true",
+                                            "--green_dashed=yes"]),
+    "clones":               ("clones.svg", ["--paper_size=a3l", "--use_colors=true",
+                                            "--green_dashed=yes"]),
+    "styles":               ("styles.svg", ["--paper_size=a3l", "--use_colors=true"]),
+    "path_commands":        ("commands.svg", ["--paper_size=a3l", "--use_colors=true"]),
+    "labels_region":        ("labels.svg", ["--paper_size=a3l", "--cut_scope=region",
+                                            "--region_x=40", "--region_y=25",
+                                            "--region_w=60", "--region_h=40"]),
+    "text_clustered":       ("text.svg", ["--paper_size=a3l", "--corner_sensitivity=90",
+                                          "--route_cluster=4"]),
+    "islands_hilbert":      ("islands.svg", ["--paper_size=a3l", "--route_seed=hilbert"]),
+    "text_route_budget":    ("text.svg", ["--paper_size=a3l", "--corner_sensitivity=90",
+                                          "--route_budget=5"]),
+    "styles_settings":      ("styles.svg", ["--paper_size=a3l", "--use_colors=true",
+                                            "--black_seq=1", "--green_seq=1", "--yellow_seq=1",
+                                            "--red_seq=1", "--green_tool=P0",
+                                            "--sequence=settings"]),
+    "text_quantized":       ("text.svg", ["--paper_size=a3l", "--corner_sensitivity=90",
+                                          "--quantize=true"]),
+    "islands_quantized":    ("islands.svg", ["--paper_size=a3l", "--quantize=true"]),
+}
+
+# quantized case -> the same job in float mode. Quantized output must not
+# be larger (commands or bytes) than its float twin.
+QUANTIZED_PAIRS = {
+    "text_quantized":    "text",
+    "islands_quantized": "islands",
+}
+
+SAMPLE_STEP = 4      # plotter units between Hausdorff sample points (0.1 mm)
+ROUTE_STEP  = 1e-4   # "seconds" one budget check costs on the step clock
+
+
+class StepClock:
+    """Stands in for skycut_v5_eng.ROUTE_CLOCK: every call advances by
+    ROUTE_STEP, so --route_budget cases stop after the same number of
+    improve_tour() checks on any machine, however loaded."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        self.now += ROUTE_STEP
+        return self.now
+
+
+def build(case):
+    svg, args = CASES[case]
+    skycut_v5_eng.ROUTE_CLOCK = StepClock()
+    ext = SkyCutV5Eng()
+    ext.parse_arguments(args + [os.path.join(CORPUS_DIR, svg)])
+    with contextlib.redirect_stderr(io.StringIO()):
+        ext.load_raw()
+        output = ext._build_hpgl()
+    ext.clean_up()
+    return output.decode("ascii") if output else ""
+
+
+# ----------------------------------------------------------------------
+# HPGL geometry
+# ----------------------------------------------------------------------
+
+def moves(hpgl):
+    """Yields (kind, (x0, y0), (x1, y1)) for every U/D move."""
+    x = y = 0
+    for cmd in hpgl.split(";"):
+        cmd = cmd.strip()
+        if not cmd or cmd[0] not in "UD" or cmd.startswith("US"):
+            continue
+        try:
+            nx, ny = (int(v) for v in cmd[1:].split(","))
+        except ValueError:
+            continue
+        yield cmd[0], (x, y), (nx, ny)
+        x, y = nx, ny
+
+
+def metrics(hpgl):
+    cut = travel = 0.0
+    for kind, a, b in moves(hpgl):
+        d = math.hypot(b[0]-a[0], b[1]-a[1]) / SCALE
+        if kind == "D":
+            cut += d
+        else:
+            travel += d
+    est = estimate_cut_time(hpgl)
+    return {
+        "commands":  sum(1 for c in hpgl.split(";") if c.strip()),
+        "bytes":     len(hpgl.encode()),
+        "cut_mm":    round(cut, 2),
+        "travel_mm": round(travel, 2),
+        "time_s":    round(est["total_s"], 2),
+    }
+
+
+def cut_samples(hpgl):
+    """Points every SAMPLE_STEP units along all pen-down moves."""
+    pts = []
+    for kind, a, b in moves(hpgl):
+        if kind != "D":
+            continue
+        n = max(1, int(math.ceil(math.hypot(b[0]-a[0], b[1]-a[1]) / SAMPLE_STEP)))
+        for k in range(n + 1):
+            t = k / n
+            pts.append((a[0] + (b[0]-a[0])*t, a[1] + (b[1]-a[1])*t))
+    return pts
+
+
+def _directed_hausdorff(src, dst, cell):
+    grid = {}
+    for p in dst:
+        grid.setdefault((int(p[0] // cell), int(p[1] // cell)), []).append(p)
+    if not grid:
+        return math.inf if src else 0.0
+    worst = 0.0
+    for p in src:
+        gx, gy = int(p[0] // cell), int(p[1] // cell)
+        best = math.inf
+        r = 0
+        # Ring r can only hold points farther than (r - 1) * cell
+        while best > (r - 1) * cell and r < 10000:
+            for ix in range(gx - r, gx + r + 1):
+                for iy in (range(gy - r, gy + r + 1) if ix in (gx - r, gx + r)
+                           else (gy - r, gy + r)):
+                    for q in grid.get((ix, iy), ()):
+                        d = math.hypot(p[0]-q[0], p[1]-q[1])
+                        if d < best:
+                            best = d
+            r += 1
+        worst = max(worst, best)
+    return worst
+
+
+def hausdorff_mm(hpgl_a, hpgl_b):
+    a, b = cut_samples(hpgl_a), cut_samples(hpgl_b)
+    cell = SAMPLE_STEP * 8
+    return max(_directed_hausdorff(a, b, cell),
+               _directed_hausdorff(b, a, cell)) / SCALE
+
+
+# ----------------------------------------------------------------------
+
+def git_commit():
+    """Short hash of HEAD; "-dirty" is added when the engine has uncommitted
+    changes, as the metrics are then not those of that commit."""
+    try:
+        commit = subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=HERE,
+            stderr=subprocess.DEVNULL, text=True).strip()
+        dirty = subprocess.check_output(
+            ["git", "status", "--porcelain", "--", os.path.join("..", "extensions")],
+            cwd=HERE, stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return commit + "-dirty" if dirty else commit
+
+
+def record_metrics(records):
+    """Appends records to METRICS_LOG, replacing any earlier record of the
+    same commit and case, so a re-run does not count a commit twice."""
+    done = {(r["commit"], r["case"]) for r in records}
+    kept = []
+    if os.path.exists(METRICS_LOG):
+        with open(METRICS_LOG, encoding="utf-8") as f:
+            kept = [line for line in f if line.strip()
+                    and (json.loads(line)["commit"], json.loads(line)["case"]) not in done]
+    with open(METRICS_LOG, "w", encoding="utf-8") as f:
+        f.writelines(kept)
+        for r in records:
+            f.write(json.dumps(r, sort_keys=True) + "\n")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("-k", dest="pattern", default="", help="only cases containing this")
+    ap.add_argument("--update", action="store_true", help="rewrite the golden files")
+    ap.add_argument("--exact", action="store_true", help="fail on any byte difference")
+    ap.add_argument("--tol", type=float, default=0.05,
+                    help="max Hausdorff distance in mm (default 0.05)")
+    ap.add_argument("--record", action="store_true", help="append to metrics.jsonl")
+    args = ap.parse_args()
+
+    cases = [c for c in CASES if args.pattern in c]
+    commit = git_commit()
+    failures = 0
+    records = []
+    built = {}
+    print(f"{'case':22} {'result':10} {'hausdorff':>9}  {'cmds':>12} {'bytes':>14} "
+          f"{'cut mm':>16} {'pen-up mm':>16} {'time s':>12}")
+    for case in cases:
+        out = build(case)
+        golden_path = os.path.join(GOLDEN_DIR, case + ".hpgl")
+        if args.update:
+            with open(golden_path, "w", encoding="utf-8") as f:
+                f.write(out)
+        m = built[case] = metrics(out)
+        records.append({"commit": commit, "date": time.strftime("%Y-%m-%d"),
+                        "case": case, **m})
+        if not os.path.exists(golden_path):
+            print(f"{case:22} {'NO GOLDEN':10}")
+            failures += 1
+            continue
+        with open(golden_path, encoding="utf-8") as f:
+            golden = f.read()
+        g = metrics(golden)
+        if out == golden:
+            result, dist = "exact", 0.0
+        else:
+            dist = hausdorff_mm(out, golden)
+            result = "same-geom" if dist <= args.tol else "DIFFERENT"
+            if result == "DIFFERENT" or args.exact:
+                failures += 1
+
+        def col(key, width):
+            if m[key] == g[key]:
+                return f"{m[key]:>{width}}"
+            return f"{g[key]}->{m[key]}".rjust(width)
+        print(f"{case:22} {result:10} {dist:9.3f}  {col('commands', 12)} "
+              f"{col('bytes', 14)} {col('cut_mm', 16)} {col('travel_mm', 16)} "
+              f"{col('time_s', 12)}")
+
+    for q_case, f_case in QUANTIZED_PAIRS.items():
+        if q_case not in built or f_case not in built:
+            continue
+        q, f = built[q_case], built[f_case]
+        ok = q["commands"] <= f["commands"] and q["bytes"] <= f["bytes"]
+        print(f"{q_case:22} {'smaller' if ok else 'LARGER':10} than {f_case}: "
+              f"{q['commands']} vs {f['commands']} cmds, {q['bytes']} vs {f['bytes']} bytes")
+        if not ok:
+            failures += 1
+
+    if args.record:
+        record_metrics(records)
+    if args.update:
+        print(f"Golden files updated ({len(cases)} cases).")
+    elif failures:
+        print(f"{failures} case(s) failed.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
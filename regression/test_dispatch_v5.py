@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+test_dispatch_v5.py — checks for the multi-plotter dispatch of the v5 engine
+(parse_endpoints, PlotterPool).
+
+The plotters are fake: local TCP servers that log the size of each job they
+get. Nothing leaves the machine. The pool runs on a fake clock, so the timed
+mode is checked without real waits or timing tolerances.
+
+Usage:
+  python3 test_dispatch_v5.py          # run all checks, exit 1 on failure
+  python3 -m pytest test_dispatch_v5.py
+"""
+
+import asyncio
+import contextlib
+import io
+import os
+import socket
+import socketserver
+import sys
+import threading
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "extensions"))
+
+from skycut_v5_eng import PlotterPool, parse_endpoints  # noqa: E402
+
+BUSY = 0.25          # seconds a fake plotter stays busy with one job
+
+
+class FakePlotter(socketserver.ThreadingTCPServer):
+    """Accepts jobs on 127.0.0.1 and logs the bytes of each job."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        self.jobs = []
+        self.lock = threading.Lock()
+        super().__init__(("127.0.0.1", 0), _Handler)
+        threading.Thread(target=self.serve_forever, args=(0.02,), daemon=True).start()
+
+    @property
+    def endpoint(self):
+        return self.server_address
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+
+    def wait_jobs(self, n, timeout=2.0):
+        """The pool returns once the data is sent; the handler may still be
+        reading it. Waits until n jobs are logged, returns the job count."""
+        end = time.perf_counter() + timeout
+        while len(self.jobs) < n and time.perf_counter() < end:
+            time.sleep(0.01)
+        return len(self.jobs)
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        size = 0
+        while True:
+            chunk = self.request.recv(65536)
+            if not chunk:
+                break
+            size += len(chunk)
+        with self.server.lock:
+            self.server.jobs.append(size)
+
+
+def closed_endpoint():
+    """An address on which nothing listens (connection refused)."""
+    s = socket.socket()
+    s.bind(("127.0.0.1", 0))
+    ep = s.getsockname()
+    s.close()
+    return ep
+
+
+class FakeClock:
+    """Time source for PlotterPool: sleep() moves the clock on at once
+    instead of waiting."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+        await asyncio.sleep(0)
+
+
+def run_pool(endpoints, jobs, reuse=False):
+    clock = FakeClock()
+    pool = PlotterPool(endpoints, timeout=5, reuse=reuse, clock=clock, sleep=clock.sleep)
+    with contextlib.redirect_stderr(io.StringIO()):
+        pool.run(jobs)
+    return pool
+
+
+def sends(pool, ep):
+    """Send start times (fake clock) of the jobs that went to ep."""
+    return [t for e, _, t in pool.log if e == ep]
+
+
+# ----------------------------------------------------------------------
+# parse_endpoints
+# ----------------------------------------------------------------------
+
+def test_parse_endpoints_ports_and_separators():
+    got = parse_endpoints("10.0.0.2:9000, 10.0.0.3;10.0.0.4\n plotter.local:81", 8080)
+    assert got == [("10.0.0.2", 9000), ("10.0.0.3", 8080), ("10.0.0.4", 8080),
+                   ("plotter.local", 81)]
+
+
+def test_parse_endpoints_empty():
+    assert parse_endpoints("", 8080) == []
+    assert parse_endpoints(None, 8080) == []
+    assert parse_endpoints(" , ;", 8080) == []
+
+
+def test_parse_endpoints_skips_invalid_port():
+    with contextlib.redirect_stderr(io.StringIO()) as err:
+        got = parse_endpoints("10.0.0.2:abc,10.0.0.3:82", 8080)
+    assert got == [("10.0.0.3", 82)]
+    assert "10.0.0.2:abc" in err.getvalue()
+
+
+# ----------------------------------------------------------------------
+# PlotterPool
+# ----------------------------------------------------------------------
+
+def test_pool_one_copy_per_plotter_by_default():
+    plotter = FakePlotter()
+    data = b"IN;U0,0;D400,400;@"
+    pool = run_pool([plotter.endpoint], [(f"copy {k+1}", data, BUSY) for k in range(3)])
+    assert plotter.wait_jobs(1) == 1
+    assert plotter.jobs == [len(data)]
+    assert pool.pending == ["copy 2", "copy 3"]
+    assert not pool.failed
+    st = pool.stats[plotter.endpoint]
+    assert st["jobs"] == 1 and st["errors"] == 0
+    plotter.close()
+
+
+def test_pool_spreads_copies_over_plotters():
+    plotters = [FakePlotter(), FakePlotter()]
+    pool = run_pool([p.endpoint for p in plotters],
+                    [(f"copy {k+1}", b"IN;@", BUSY) for k in range(3)])
+    assert [p.wait_jobs(1) for p in plotters] == [1, 1]
+    assert pool.pending == ["copy 3"]
+    assert not pool.failed
+    for p in plotters:
+        p.close()
+
+
+def test_pool_timed_waits_for_cut_before_next_copy():
+    plotter = FakePlotter()
+    pool = run_pool([plotter.endpoint], [(f"copy {k+1}", b"IN;@", BUSY) for k in range(3)],
+                    reuse=True)
+    assert plotter.wait_jobs(3) == 3
+    # The fake clock only moves in sleep(): the send itself takes no time
+    assert sends(pool, plotter.endpoint) == [0.0, BUSY, 2 * BUSY]
+    st = pool.stats[plotter.endpoint]
+    assert st["jobs"] == 3 and st["busy_s"] == 3 * BUSY
+    assert not pool.pending and not pool.failed
+    plotter.close()
+
+
+def test_pool_timed_keeps_each_plotter_busy():
+    plotters = [FakePlotter(), FakePlotter()]
+    pool = run_pool([p.endpoint for p in plotters],
+                    [(f"copy {k+1}", b"IN;@", BUSY) for k in range(4)], reuse=True)
+    assert sum(p.wait_jobs(2) for p in plotters) == 4
+    for p in plotters:
+        t = sends(pool, p.endpoint)
+        assert t and all(b - a >= BUSY for a, b in zip(t, t[1:])), t
+    assert not pool.pending and not pool.failed
+    for p in plotters:
+        p.close()
+
+
+def test_pool_drops_dead_plotter_and_requeues_job():
+    plotter = FakePlotter()
+    dead = closed_endpoint()
+    pool = run_pool([dead, plotter.endpoint], [(f"copy {k+1}", b"IN;@", 0.0) for k in range(3)],
+                    reuse=True)
+    assert plotter.wait_jobs(3) == 3
+    assert pool.stats[dead]["errors"] == 1 and pool.stats[dead]["jobs"] == 0
+    assert not pool.failed
+    plotter.close()
+
+
+def test_pool_dead_plotter_job_goes_to_the_other_one():
+    plotter = FakePlotter()
+    dead = closed_endpoint()
+    pool = run_pool([dead, plotter.endpoint], [("copy 1", b"IN;@", 0.0),
+                                               ("copy 2", b"IN;@", 0.0)])
+    assert plotter.wait_jobs(1) == 1
+    assert pool.stats[dead]["errors"] == 1
+    assert len(pool.pending) == 1 and not pool.failed
+    plotter.close()
+
+
+def test_pool_reports_jobs_no_plotter_took():
+    pool = run_pool([closed_endpoint()], [("copy 1", b"IN;@", 0.0), ("copy 2", b"IN;@", 0.0)])
+    assert sorted(pool.failed) == ["copy 1", "copy 2"]
+
+
+def test_pool_ignores_duplicate_endpoints():
+    plotter = FakePlotter()
+    pool = run_pool([plotter.endpoint, plotter.endpoint], [("copy 1", b"IN;@", 0.0)])
+    assert list(pool.stats) == [plotter.endpoint]
+    assert plotter.wait_jobs(1) == 1
+    plotter.close()
+
+
+# ----------------------------------------------------------------------
+
+def main():
+    tests = [(name, fn) for name, fn in sorted(globals().items())
+             if name.startswith("test_") and callable(fn)]
+    failures = 0
+    for name, fn in tests:
+        try:
+            fn()
+        except AssertionError as e:
+            failures += 1
+            print(f"{name:50} FAIL {e}")
+        else:
+            print(f"{name:50} ok")
+    if failures:
+        print(f"{failures} check(s) failed.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+test_profile_v5.py — checks for the --profile modes of the v5 engine
+(SkyCutV5Eng._run_profiled).
+
+Every check runs a small corpus job with --save_hpgl into a temporary
+directory, so nothing is sent and no viewer opens.
+
+Usage:
+  python3 test_profile_v5.py           # run all checks, exit 1 on failure
+  python3 -m pytest test_profile_v5.py
+"""
+
+import contextlib
+import glob
+import io
+import os
+import sys
+import tempfile
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "extensions"))
+
+from skycut_v5_eng import SkyCutV5Eng  # noqa: E402
+
+SVG = os.path.join(HERE, "corpus", "mixed.svg")
+
+
+def run_profiled(mode, out_dir):
+    """Runs the job with --profile=mode; returns the saved HPGL path."""
+    hpgl = os.path.join(out_dir, "out.hpgl")
+    with contextlib.redirect_stderr(io.StringIO()):
+        SkyCutV5Eng().run([f"--profile={mode}", f"--profile_dir={out_dir}",
+                           "--save_hpgl=true", f"--output_path={hpgl}", SVG],
+                          output=io.BytesIO())
+    return hpgl
+
+
+def test_tracemalloc_started_and_stopped_by_the_run():
+    assert not tracemalloc.is_tracing()
+    with tempfile.TemporaryDirectory() as d:
+        hpgl = run_profiled("tracemalloc", d)
+        assert os.path.getsize(hpgl) > 0
+        alloc = glob.glob(os.path.join(d, "skycut_*_alloc.txt"))
+        assert len(alloc) == 1
+        with open(alloc[0], encoding="utf-8") as f:
+            assert "by growth over the run" in f.read()
+    assert not tracemalloc.is_tracing()
+
+
+def test_cprofile_with_tracing_already_on():
+    # PYTHONTRACEMALLOC=1 or a host that traces: cProfile mode must neither
+    # touch the tracemalloc report nor stop the caller's tracing
+    tracemalloc.start()
+    try:
+        with tempfile.TemporaryDirectory() as d:
+            hpgl = run_profiled("cprofile", d)
+            assert os.path.getsize(hpgl) > 0
+            assert glob.glob(os.path.join(d, "skycut_*.prof"))
+            assert not glob.glob(os.path.join(d, "skycut_*_alloc.txt"))
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
+
+
+def test_tracemalloc_with_tracing_already_on():
+    tracemalloc.start()
+    try:
+        with tempfile.TemporaryDirectory() as d:
+            hpgl = run_profiled("both", d)
+            assert os.path.getsize(hpgl) > 0
+            assert glob.glob(os.path.join(d, "skycut_*_alloc.txt"))
+            assert glob.glob(os.path.join(d, "skycut_*.prof"))
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
+
+
+# ----------------------------------------------------------------------
+
+def main():
+    tests = [(name, fn) for name, fn in sorted(globals().items())
+             if name.startswith("test_") and callable(fn)]
+    failures = 0
+    for name, fn in tests:
+        try:
+            fn()
+        except AssertionError as e:
+            failures += 1
+            print(f"{name:50} FAIL {e}")
+        else:
+            print(f"{name:50} ok")
+    if failures:
+        print(f"{failures} check(s) failed.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()